@@ -13,6 +13,7 @@ import json
 import asyncio
 import websockets
 import base64
+from collections import deque
 from datetime import datetime, timedelta
 from aiohttp import web
 from typing import Dict, List, Optional, Set
@@ -20,6 +21,50 @@ import traceback
 import RPi.GPIO as GPIO
 import threading
 import time
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import math
+
+try:
+    from picamera2 import Picamera2
+    PICAMERA2_AVAILABLE = True
+except ImportError:
+    PICAMERA2_AVAILABLE = False
+
+try:
+    from tflite_runtime.interpreter import Interpreter, load_delegate
+    TFLITE_AVAILABLE = True
+except ImportError:
+    TFLITE_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _best_match(known_matrix, encoding):
+        """Return (index, distance) of the closest known encoding in one fused pass"""
+        best_index = -1
+        best_sq = np.inf
+        for i in range(known_matrix.shape[0]):
+            d = 0.0
+            for j in range(known_matrix.shape[1]):
+                t = known_matrix[i, j] - encoding[j]
+                d += t * t
+            if d < best_sq:
+                best_sq = d
+                best_index = i
+        return best_index, math.sqrt(best_sq)
+else:
+    def _best_match(known_matrix, encoding):
+        """Return (index, distance) of the closest known encoding"""
+        distances = np.linalg.norm(known_matrix - encoding, axis=1)
+        best_index = int(distances.argmin())
+        return best_index, float(distances[best_index])
 
 class DoorLockController:
     def __init__(self, relay_pin=12, lock_duration=5):
@@ -111,12 +156,167 @@ class DoorLockController:
         except Exception as e:
             print(f"Error cleaning up door lock controller: {e}")
 
+def _pin_thread_to_cpu(cpu: int) -> None:
+    """Pin the calling thread to one CPU core (executor initializer; no-op where unsupported)"""
+    try:
+        if cpu in os.sched_getaffinity(0):
+            os.sched_setaffinity(0, {cpu})
+    except (AttributeError, OSError) as e:
+        print(f"Could not pin thread to CPU {cpu}: {e}")
+
+def _pin_thread_to_next_cpu(cpus) -> None:
+    """Pin the calling thread to the next core from a shared iterator, so each pool thread gets its own"""
+    _pin_thread_to_cpu(next(cpus))
+
+def _reset_cpu_affinity() -> None:
+    """Let a worker process run on every core again (executor initializer); workers are
+    forked from a pinned thread and would otherwise inherit its single-core affinity"""
+    try:
+        os.sched_setaffinity(0, range(os.cpu_count() or 1))
+    except (AttributeError, OSError) as e:
+        print(f"Could not reset CPU affinity: {e}")
+
+# Exact keepalive message sent by the app (JSON.stringify({type: 'ping'})) and its reply
+PING_MESSAGE = '{"type":"ping"}'
+PONG_MESSAGE = '{"type": "pong"}'
+
+def _put_latest(q: queue.Queue, item) -> None:
+    """Put item into a single-slot queue, replacing an item nobody picked up yet"""
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(item)
+
+class PiCamera2Capture:
+    """Minimal cv2.VideoCapture-style wrapper around Picamera2 (libcamera) capture"""
+    def __init__(self, size=(640, 480), lores_size=(160, 120)):
+        """
+        size: Main stream size used for display
+        lores_size: Low-res stream size used for face detection (1/4 of size)
+        """
+        self.picam = Picamera2()
+        # RGB888 is laid out as BGR in memory, which is what OpenCV expects
+        config = self.picam.create_video_configuration(
+            main={'size': size, 'format': 'RGB888'},
+            lores={'size': lores_size, 'format': 'YUV420'}
+        )
+        self.picam.configure(config)
+        self.picam.start()
+        self.lores_height = lores_size[1]
+        self.last_lores = None  # Luma plane of the low-res stream for the last frame read
+        self._opened = True
+    
+    def isOpened(self):
+        return self._opened
+    
+    def read(self):
+        """Capture one frame from both streams; returns (ret, main_frame) like VideoCapture.read"""
+        try:
+            request = self.picam.capture_request()
+            try:
+                frame = request.make_array('main')
+                # YUV420 arrays are (h*3/2, w); the first h rows are the Y (grayscale) plane
+                self.last_lores = request.make_array('lores')[:self.lores_height]
+            finally:
+                request.release()
+            return True, frame
+        except Exception as e:
+            print(f"Error capturing from Picamera2: {e}")
+            return False, None
+    
+    def release(self):
+        if self._opened:
+            self.picam.stop()
+            self.picam.close()
+            self._opened = False
+
+class MobileFaceNetEncoder:
+    """Quantized MobileFaceNet (TFLite) face encoder, run on a Coral Edge TPU when one is attached"""
+    MATCH_SIMILARITY = 0.5  # Minimum cosine similarity between embeddings for a match
+    
+    @classmethod
+    def max_match_distance(cls) -> float:
+        """Euclidean distance equivalent to MATCH_SIMILARITY (embeddings are L2-normalized)"""
+        return math.sqrt(2 * (1 - cls.MATCH_SIMILARITY))
+    
+    @staticmethod
+    def confidence(distance: float) -> float:
+        """Cosine similarity of two L2-normalized embeddings from their Euclidean distance"""
+        return 1 - distance * distance / 2
+    
+    def __init__(self, model_path='mobilefacenet_int8.tflite', use_edgetpu=True):
+        """
+        model_path: int8 MobileFaceNet model with a 128-d output
+        use_edgetpu: Try the Coral delegate first, otherwise run on CPU (XNNPACK)
+        """
+        delegates = []
+        if use_edgetpu:
+            try:
+                delegates = [load_delegate('libedgetpu.so.1')]
+                print("MobileFaceNet running on Edge TPU")
+            except (ValueError, OSError) as e:
+                print(f"Edge TPU not available, running MobileFaceNet on CPU: {e}")
+        
+        self.interpreter = Interpreter(model_path=model_path, experimental_delegates=delegates)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.input_size = tuple(self.input_details['shape'][1:3])  # (height, width), usually 112x112
+        if self.output_details['shape'][-1] != 128:
+            raise ValueError(f"Expected a 128-d embedding, model outputs {self.output_details['shape'][-1]}")
+        # The interpreter isn't thread-safe; enrollment and recognition run on different threads
+        self._lock = threading.Lock()
+    
+    def encode(self, rgb_image, face_locations) -> List[np.ndarray]:
+        """Return one L2-normalized 128-d embedding per (top, right, bottom, left) face box"""
+        in_scale, in_zero_point = self.input_details['quantization']
+        out_scale, out_zero_point = self.output_details['quantization']
+        encodings = []
+        for top, right, bottom, left in face_locations:
+            face = rgb_image[max(0, top):bottom, max(0, left):right]
+            if face.size == 0:
+                encodings.append(np.zeros(128, dtype=np.float32))
+                continue
+            face = cv2.resize(face, (self.input_size[1], self.input_size[0]))
+            
+            # Normalize to [-1, 1] as in training, then quantize to the input tensor's int8 range
+            normalized = (face.astype(np.float32) - 127.5) / 128.0
+            if in_scale:
+                normalized = np.round(normalized / in_scale + in_zero_point)
+                normalized = np.clip(normalized, -128, 127)
+            input_tensor = normalized.astype(self.input_details['dtype'])[np.newaxis]
+            
+            with self._lock:
+                self.interpreter.set_tensor(self.input_details['index'], input_tensor)
+                self.interpreter.invoke()
+                output = self.interpreter.get_tensor(self.output_details['index'])[0]
+            
+            embedding = output.astype(np.float32)
+            if out_scale:
+                embedding = (embedding - out_zero_point) * out_scale
+            encodings.append(embedding / (np.linalg.norm(embedding) or 1.0))
+        return encodings
+
 class FaceRecognitionSystem:
-    def __init__(self, tolerance=0.6, model='hog', auto_unlock=True, unlock_confidence=0.8):
+    JPEG_ENCODE_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 80]  # Live preview doesn't need more
+    
+    # OpenCV DNN (ResNet-10 SSD) face detector files, from the OpenCV samples
+    DNN_MODEL_FILE = 'opencv_face_detector_uint8.pb'
+    DNN_CONFIG_FILE = 'opencv_face_detector.pbtxt'
+    DNN_CONFIDENCE = 0.6
+    DNN_INPUT_SIZE = (300, 300)  # Input size the SSD was trained at
+    
+    LOG_DEBOUNCE = 2.0  # Seconds between logged/broadcast recognitions of the same person
+    
+    def __init__(self, tolerance=0.6, model='dnn', auto_unlock=True, unlock_confidence=0.8):
         """
         Initialize face recognition system
         tolerance: Lower values = more strict matching
-        model: 'hog' for CPU (faster on Pi), 'cnn' for GPU (more accurate)
+        model: 'dnn' for OpenCV SSD (fastest on Pi), 'hog' for dlib CPU, 'cnn' for GPU (more accurate)
         auto_unlock: Automatically unlock door when recognized face is detected
         unlock_confidence: Minimum confidence required for auto unlock
         """
@@ -126,13 +326,98 @@ class FaceRecognitionSystem:
         self.unlock_confidence = unlock_confidence
         self.known_face_encodings = []
         self.known_face_names = []
+        self._known_matrix = np.empty((0, 128), dtype=np.float32)  # Contiguous (N,128) copy of known_face_encodings
+        self._known_names = []  # Names aligned with _known_matrix rows
+        self._authorized_mask = np.zeros(0, dtype=bool)  # Per-row authorization, derived from authorized_users
+        self._known_lock = threading.Lock()  # Guards the matrix/names snapshot read by the recognition thread
         self.authorized_users = set()  # Users authorized to unlock door
         self.data_file = 'face_data.pkl'
-        self.log_file = 'recognition_log.json'
+        self.log_file = 'recognition_log.jsonl'  # One JSON entry per line, append-only
+        self.max_log_entries = 1000
+        self._log_appends = 0  # Lines appended since the log was last trimmed
+        self._log_lock = threading.Lock()  # Appends run on executor threads
         self.config_file = 'door_config.json'
         self.clients: Set[websockets.WebSocketServerProtocol] = set()
         self.camera = None
         self.running = False
+        self._capture_thread: Optional[threading.Thread] = None
+        self._capture_queue: Optional[queue.Queue] = None  # Newest (frame, lores) from the capture thread
+        self._frame_queue: Optional[asyncio.Queue] = None
+        self._ts_second = None  # Second the cached timestamp prefix was formatted for
+        self._ts_prefix = ''
+        self._last_seen: Dict[str, float] = {}  # Name -> monotonic time of last logged recognition
+        
+        # Face detection is the dominant per-frame cost, so only run it every
+        # _frame_skip frames and reuse the previous locations in between
+        self._frame_skip = 2
+        self._detect_count = 0
+        self._last_locations = []
+        
+        # Scratch buffers for the downscaled BGR/RGB frames (only touched by the recognition thread)
+        self._small_frame = None
+        self._small_rgb = None
+        
+        # 'small' = 5-point landmarks (faster), 'large' = 68-point landmarks
+        self.landmark_model = 'small'
+        self.num_jitters = 1
+        
+        # Per-face encoding is spread across processes when a frame has several faces.
+        # Workers are spawned, not forked: by the time they start, camera and pool threads may hold
+        # locks a forked child would inherit. They are started on demand from the pinned recognition
+        # thread and inherit its affinity, so they reset it to use every core
+        self._face_pool = ProcessPoolExecutor(
+            max_workers=max(1, (os.cpu_count() or 2) - 1),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_reset_cpu_affinity
+        )
+        
+        # Detection/encoding runs on a single dedicated thread so dlib work doesn't block the event loop.
+        # It is pinned to core 3 (isolate it with isolcpus=3) so it keeps its caches warm,
+        # the two JPEG encoding threads get cores 1 and 2 and the event loop is left with core 0
+        self._recognition_pool = ThreadPoolExecutor(
+            max_workers=1, initializer=_pin_thread_to_cpu, initargs=(3,)
+        )
+        
+        # JPEG encoding runs here so it doesn't block the event loop
+        self._encode_pool = ThreadPoolExecutor(
+            max_workers=2, initializer=_pin_thread_to_next_cpu, initargs=(iter((1, 2)),)
+        )
+        
+        # OpenCV's SSD detector is several times faster than dlib HOG on the Pi;
+        # fall back to HOG if the model files aren't installed
+        self._face_detector = None
+        if self.model == 'dnn':
+            if os.path.exists(self.DNN_MODEL_FILE) and os.path.exists(self.DNN_CONFIG_FILE):
+                self._face_detector = cv2.dnn.readNetFromTensorflow(self.DNN_MODEL_FILE, self.DNN_CONFIG_FILE)
+                self._face_detector.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+                self._face_detector.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+                print("Using OpenCV DNN face detector")
+            else:
+                print(f"DNN face detector files not found ({self.DNN_MODEL_FILE}), falling back to HOG")
+                self.model = 'hog'
+        
+        # 'dlib' = ResNet encoder from face_recognition, 'mobilefacenet' = TFLite model
+        # (the two embedding spaces aren't compatible, so stored faces record which one made them)
+        self.encoder = 'dlib'
+        self._data_encoder = 'dlib'
+        self._tflite_encoder = None
+        self._max_match_distance = tolerance  # Set per encoder by _init_encoder
+        
+        # Compile the matching kernel now rather than on the first recognized face
+        _best_match(np.zeros((1, 128), dtype=np.float32), np.zeros(128, dtype=np.float32))
+        
+        # Message type -> handler, looked up once per message in handle_message
+        self._message_handlers = {
+            'add_user': self._handle_add_user,
+            'remove_user': self._handle_remove_user,
+            'unlock_door': self._handle_unlock_door,
+            'lock_door': self._handle_lock_door,
+            'get_door_status': self._handle_get_door_status,
+            'set_user_authorization': self._handle_set_user_authorization,
+            'update_door_config': self._handle_update_door_config,
+            'get_users': self._handle_get_users,
+            'ping': self._handle_ping
+        }
         
         # Initialize door lock controller
         self.door_lock = DoorLockController()
@@ -140,6 +425,7 @@ class FaceRecognitionSystem:
         # Load existing face data and config
         self.load_face_data()
         self.load_config()
+        self.trim_log_file()
     
     def load_face_data(self) -> None:
         """Load previously saved face encodings and names"""
@@ -147,11 +433,18 @@ class FaceRecognitionSystem:
             try:
                 with open(self.data_file, 'rb') as f:
                     data = pickle.load(f)
-                    self.known_face_encodings = data['encodings']
+                    if 'matrix' in data:
+                        # Current format: all encodings as one (N,128) matrix
+                        self.known_face_encodings = list(data['matrix'])
+                    else:
+                        # Older files store a list of per-face encodings
+                        self.known_face_encodings = data['encodings']
                     self.known_face_names = data['names']
+                    self._data_encoder = data.get('encoder', 'dlib')
                     # Load authorized users if available
                     if 'authorized_users' in data:
                         self.authorized_users = set(data['authorized_users'])
+                    self._rebuild_known_matrix()
                 print(f"Loaded {len(self.known_face_names)} known faces")
                 print(f"Authorized users: {list(self.authorized_users)}")
             except Exception as e:
@@ -159,17 +452,38 @@ class FaceRecognitionSystem:
                 self.known_face_encodings = []
                 self.known_face_names = []
                 self.authorized_users = set()
+                self._rebuild_known_matrix()
+    
+    def _rebuild_known_matrix(self) -> None:
+        """Stack known encodings into a contiguous float32 matrix for vectorized matching"""
+        if self.known_face_encodings:
+            matrix = np.ascontiguousarray(
+                np.vstack(self.known_face_encodings), dtype=np.float32
+            )
+        else:
+            matrix = np.empty((0, 128), dtype=np.float32)
+        authorized_mask = np.array(
+            [name in self.authorized_users for name in self.known_face_names], dtype=bool
+        )
+        
+        # Swap matrix, names and mask together so the recognition thread never sees them out of step
+        with self._known_lock:
+            self._known_matrix = matrix
+            self._known_names = list(self.known_face_names)
+            self._authorized_mask = authorized_mask
     
     def save_face_data(self) -> None:
-        """Save face encodings and names to file"""
+        """Save face encodings and names to file (callers rebuild the known matrix after each change)"""
         try:
             data = {
-                'encodings': self.known_face_encodings,
+                'matrix': self._known_matrix,
                 'names': self.known_face_names,
-                'authorized_users': list(self.authorized_users)
+                'authorized_users': list(self.authorized_users),
+                'encoder': self.encoder
             }
+            # Protocol 5 writes the matrix as a single contiguous buffer
             with open(self.data_file, 'wb') as f:
-                pickle.dump(data, f)
+                pickle.dump(data, f, protocol=5)
             print(f"Saved {len(self.known_face_names)} faces to {self.data_file}")
         except Exception as e:
             print(f"Error saving face data: {e}")
@@ -183,9 +497,37 @@ class FaceRecognitionSystem:
                     self.auto_unlock = config.get('auto_unlock', True)
                     self.unlock_confidence = config.get('unlock_confidence', 0.8)
                     self.door_lock.lock_duration = config.get('lock_duration', 5)
+                    self.encoder = config.get('encoder', 'dlib')
                 print(f"Loaded door configuration: auto_unlock={self.auto_unlock}, confidence={self.unlock_confidence}, duration={self.door_lock.lock_duration}")
             except Exception as e:
                 print(f"Error loading config: {e}")
+        self._init_encoder()
+    
+    def _init_encoder(self) -> None:
+        """Set up the configured face encoder, falling back to dlib when it can't be used"""
+        if self.encoder == 'mobilefacenet':
+            if self.known_face_names and self._data_encoder != self.encoder:
+                print(f"Stored faces were encoded with {self._data_encoder}; re-enroll users to switch encoders")
+                self.encoder = self._data_encoder
+            elif not TFLITE_AVAILABLE:
+                print("tflite_runtime not installed, using dlib encoder")
+                self.encoder = 'dlib'
+            else:
+                try:
+                    self._tflite_encoder = MobileFaceNetEncoder()
+                except Exception as e:
+                    print(f"Error loading MobileFaceNet encoder, using dlib: {e}")
+                    self.encoder = 'dlib'
+        if self.encoder != 'mobilefacenet':
+            self._tflite_encoder = None
+        self._data_encoder = self.encoder
+        
+        # dlib distances are matched against tolerance; MobileFaceNet has its own cosine threshold
+        if self._tflite_encoder is not None:
+            self._max_match_distance = MobileFaceNetEncoder.max_match_distance()
+        else:
+            self._max_match_distance = self.tolerance
+        print(f"Face encoder: {self.encoder}")
     
     def save_config(self) -> None:
         """Save door configuration"""
@@ -193,7 +535,8 @@ class FaceRecognitionSystem:
             config = {
                 'auto_unlock': self.auto_unlock,
                 'unlock_confidence': self.unlock_confidence,
-                'lock_duration': self.door_lock.lock_duration
+                'lock_duration': self.door_lock.lock_duration,
+                'encoder': self.encoder
             }
             with open(self.config_file, 'w') as f:
                 json.dump(config, f, indent=2)
@@ -201,6 +544,15 @@ class FaceRecognitionSystem:
         except Exception as e:
             print(f"Error saving config: {e}")
     
+    def _timestamp(self) -> str:
+        """Local ISO-8601 timestamp; the date/time part is only formatted once per second"""
+        now_ns = time.time_ns()
+        second, remainder_ns = divmod(now_ns, 1_000_000_000)
+        if second != self._ts_second:
+            self._ts_second = second
+            self._ts_prefix = datetime.fromtimestamp(second).strftime('%Y-%m-%dT%H:%M:%S')
+        return f"{self._ts_prefix}.{remainder_ns // 1000:06d}"
+    
     async def broadcast_event(self, event_type: str, data: dict) -> None:
         """Broadcast event to all connected clients"""
         if not self.clients:
@@ -208,63 +560,110 @@ class FaceRecognitionSystem:
             
         message = json.dumps({
             'type': event_type,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._timestamp(),
             'data': data
         })
         
-        await asyncio.gather(
-            *[client.send(message) for client in self.clients],
-            return_exceptions=True
-        )
+        # Fan the pre-serialized message out without creating a task per client
+        websockets.broadcast(self.clients, message)
     
-    async def process_frame(self, frame) -> dict:
-        """Process a single frame and return recognition results"""
-        # Resize frame for faster processing
-        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    def _downscale_to_rgb(self, frame):
+        """Resize frame to 1/4 and convert to RGB, reusing scratch buffers between frames"""
+        height, width = frame.shape[:2]
+        small_shape = (height // 4, width // 4, 3)
+        if self._small_frame is None or self._small_frame.shape != small_shape:
+            self._small_frame = np.empty(small_shape, dtype=np.uint8)
+            self._small_rgb = np.empty(small_shape, dtype=np.uint8)
+        cv2.resize(frame, (small_shape[1], small_shape[0]), dst=self._small_frame)
+        return cv2.cvtColor(self._small_frame, cv2.COLOR_BGR2RGB, dst=self._small_rgb)
+    
+    def _detect_faces_dnn(self, bgr_image, out_shape) -> List[tuple]:
+        """
+        Detect faces with the OpenCV SSD detector, returning face_recognition-style (top, right, bottom, left) boxes
+        bgr_image: Full-size frame, resized to the detector's 300x300 input
+        out_shape: (height, width) of the image the boxes are scaled to
+        """
+        height, width = out_shape[:2]
+        blob = cv2.dnn.blobFromImage(bgr_image, 1.0, self.DNN_INPUT_SIZE, [104, 117, 123], swapRB=False, crop=False)
+        self._face_detector.setInput(blob)
+        detections = self._face_detector.forward()
         
-        # Find faces and encodings
-        face_locations = face_recognition.face_locations(rgb_small_frame, model=self.model)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+        face_locations = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < self.DNN_CONFIDENCE:
+                continue
+            # Boxes are normalized to [0, 1]; clamp to the image so dlib gets valid rectangles
+            left = max(0, int(detections[0, 0, i, 3] * width))
+            top = max(0, int(detections[0, 0, i, 4] * height))
+            right = min(width - 1, int(detections[0, 0, i, 5] * width))
+            bottom = min(height - 1, int(detections[0, 0, i, 6] * height))
+            if right > left and bottom > top:
+                face_locations.append((top, right, bottom, left))
+        return face_locations
+    
+    def _process_frame_sync(self, frame, gray_small=None) -> dict:
+        """
+        Detect and identify faces in a frame (blocking, runs on the recognition thread)
+        gray_small: Optional 1/4-size grayscale frame from the camera, used for HOG detection
+        """
+        rgb_small_frame = None
+        
+        # Find faces (reusing the last detection on skipped frames)
+        if self._detect_count % self._frame_skip == 0:
+            if self._face_detector is not None:
+                # The SSD sees the full frame at 300x300; boxes come back in 1/4-size coordinates
+                rgb_small_frame = self._downscale_to_rgb(frame)
+                face_locations = self._detect_faces_dnn(frame, rgb_small_frame.shape)
+            elif gray_small is not None and self.model == 'hog':
+                # HOG runs directly on the camera's low-res luma plane, no CPU resize needed
+                face_locations = face_recognition.face_locations(gray_small, model=self.model)
+            else:
+                rgb_small_frame = self._downscale_to_rgb(frame)
+                face_locations = face_recognition.face_locations(rgb_small_frame, model=self.model)
+            self._last_locations = face_locations
+        else:
+            face_locations = self._last_locations
+        self._detect_count += 1
+        
+        # Encoding needs the RGB frame; only build it when there are faces to encode
+        if face_locations and rgb_small_frame is None:
+            rgb_small_frame = self._downscale_to_rgb(frame)
+        
+        if self._tflite_encoder is not None and face_locations:
+            face_encodings = self._tflite_encoder.encode(rgb_small_frame, face_locations)
+        elif len(face_locations) >= 2:
+            face_encodings = self._encode_faces_parallel(rgb_small_frame, face_locations)
+        elif face_locations:
+            face_encodings = face_recognition.face_encodings(
+                rgb_small_frame,
+                face_locations,
+                num_jitters=self.num_jitters,
+                model=self.landmark_model
+            )
+        else:
+            face_encodings = []
+        
+        with self._known_lock:
+            known_matrix = self._known_matrix
+            known_names = self._known_names
+            authorized_mask = self._authorized_mask
         
         results = []
         for face_encoding, (top, right, bottom, left) in zip(face_encodings, face_locations):
-            # Compare with known faces
-            matches = face_recognition.compare_faces(
-                self.known_face_encodings, 
-                face_encoding, 
-                tolerance=self.tolerance
-            )
             name = "Unknown"
             confidence = 0.0
             is_authorized = False
             
-            if len(self.known_face_encodings) > 0:
-                face_distances = face_recognition.face_distance(
-                    self.known_face_encodings, 
-                    face_encoding
+            if len(known_matrix) > 0:
+                # Single pass over the known encodings matrix (replaces compare_faces + face_distance)
+                best_match_index, best_distance = _best_match(
+                    known_matrix,
+                    face_encoding.astype(np.float32)
                 )
-                best_match_index = np.argmin(face_distances)
-                if matches[best_match_index]:
-                    name = self.known_face_names[best_match_index]
-                    confidence = float(1 - face_distances[best_match_index])
-                    is_authorized = name in self.authorized_users
-                    
-                    # Auto unlock door if conditions are met
-                    if (self.auto_unlock and is_authorized and 
-                        confidence >= self.unlock_confidence and 
-                        not self.door_lock.is_unlocked):
-                        
-                        unlock_success = self.door_lock.unlock_door()
-                        if unlock_success:
-                            await self.broadcast_event('door_unlocked', {
-                                'user': name,
-                                'confidence': confidence,
-                                'auto_unlock': True
-                            })
-                    
-                    # Log recognition event
-                    await self.log_recognition(name, confidence, is_authorized)
+                if best_distance <= self._max_match_distance:
+                    name = known_names[best_match_index]
+                    confidence = self._match_confidence(best_distance)
+                    is_authorized = bool(authorized_mask[best_match_index])
             
             # Scale coordinates back up
             results.append({
@@ -279,101 +678,245 @@ class FaceRecognitionSystem:
                 }
             })
         
-        return {
-            'faces': results,
-            'timestamp': datetime.now().isoformat(),
-            'door_status': self.door_lock.get_status()
-        }
+        return {'faces': results}
+    
+    def _match_confidence(self, distance: float) -> float:
+        """Confidence of a match at this distance, on the active encoder's scale"""
+        if self._tflite_encoder is not None:
+            return float(MobileFaceNetEncoder.confidence(distance))
+        return float(1 - distance)
+    
+    def _encode_faces_parallel(self, rgb_image, face_locations) -> list:
+        """Encode each face in a separate worker process (dlib only uses one core per call)"""
+        futures = [
+            self._face_pool.submit(
+                face_recognition.face_encodings,
+                rgb_image,
+                [location],
+                self.num_jitters,
+                self.landmark_model
+            )
+            for location in face_locations
+        ]
+        return [future.result()[0] for future in futures]
+    
+    async def process_frame(self, frame, gray_small=None) -> dict:
+        """Process a single frame and return recognition results"""
+        results = await asyncio.get_event_loop().run_in_executor(
+            self._recognition_pool,
+            self._process_frame_sync,
+            frame,
+            gray_small
+        )
+        
+        # Door control, logging and broadcasts stay on the event loop
+        for face in results['faces']:
+            name = face['name']
+            if name == "Unknown":
+                continue
+            confidence = face['confidence']
+            is_authorized = face['is_authorized']
+            
+            # Auto unlock door if conditions are met
+            if (self.auto_unlock and is_authorized and 
+                confidence >= self.unlock_confidence and 
+                not self.door_lock.is_unlocked):
+                
+                unlock_success = self.door_lock.unlock_door()
+                if unlock_success:
+                    await self.broadcast_event('door_unlocked', {
+                        'user': name,
+                        'confidence': confidence,
+                        'auto_unlock': True
+                    })
+            
+            # Log recognition event, at most once per LOG_DEBOUNCE seconds per person
+            now = time.monotonic()
+            if now - self._last_seen.get(name, 0.0) >= self.LOG_DEBOUNCE:
+                self._last_seen[name] = now
+                await self.log_recognition(name, confidence, is_authorized)
+        
+        results['timestamp'] = self._timestamp()
+        results['door_status'] = self.door_lock.get_status()
+        return results
     
     async def start_camera_stream(self) -> None:
         """Start camera stream and recognition"""
         if self.running:
             return
-            
+        
+        loop = asyncio.get_running_loop()
+        if self._capture_thread is not None:
+            # Wait (off the event loop) for the previous stream's capture thread to release the camera
+            await loop.run_in_executor(None, self._capture_thread.join)
+            self._capture_thread = None
+        
+        frame_sender = None
         try:
-            # Try different camera indices
-            for camera_index in [0, 1, 2]:
-                self.camera = cv2.VideoCapture(camera_index)
-                if self.camera.isOpened():
-                    print(f"Successfully opened camera at index {camera_index}")
-                    break
-                else:
-                    print(f"Failed to open camera at index {camera_index}")
-                    self.camera.release()
-            
-            if not self.camera.isOpened():
-                raise Exception("Failed to open any camera device")
-            
-            # Get camera properties
-            width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-            height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
-            fps = self.camera.get(cv2.CAP_PROP_FPS)
-            print(f"Camera properties - Width: {width}, Height: {height}, FPS: {fps}")
-            
-            # Set camera properties
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.camera.set(cv2.CAP_PROP_FPS, 30)
-            
-            # Verify settings were applied
-            new_width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-            new_height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
-            new_fps = self.camera.get(cv2.CAP_PROP_FPS)
-            print(f"New camera properties - Width: {new_width}, Height: {new_height}, FPS: {new_fps}")
+            await loop.run_in_executor(None, self._open_camera)
             
             self.running = True
             print("Camera stream started successfully")
             
+            # Frames go through a small queue to a single sender task so slow
+            # clients can't back-pressure the capture loop
+            self._frame_queue = asyncio.Queue(maxsize=2)
+            frame_sender = asyncio.create_task(self._send_queued_frames())
+            
+            # Capture runs on its own thread and keeps only the newest frame, so the
+            # event loop never waits on V4L2/libcamera for the next one
+            self._capture_queue = queue.Queue(maxsize=1)
+            self._capture_thread = threading.Thread(target=self._capture_frames, daemon=True)
+            self._capture_thread.start()
+            
             frame_count = 0
-            start_time = datetime.now()
+            start_time = time.monotonic()
+            
+            # Bind everything the loop touches per frame to locals once
+            next_frame = self._capture_queue.get
+            process_frame = self.process_frame
+            encode_pool = self._encode_pool
+            encode_frame = self._encode_frame_to_jpeg
+            queue_frame = self._queue_frame
+            sleep = asyncio.sleep
+            clock = time.monotonic
             
             while self.running and self.clients:
-                ret, frame = self.camera.read()
-                if not ret:
-                    print("Failed to read frame from camera")
-                    # Try to reinitialize camera
-                    self.camera.release()
-                    self.camera = cv2.VideoCapture(0)
-                    if not self.camera.isOpened():
-                        raise Exception("Failed to reinitialize camera")
+                try:
+                    frame, lores = await loop.run_in_executor(None, next_frame, True, 0.5)
+                except queue.Empty:
                     continue
                 
                 frame_count += 1
-                elapsed_time = (datetime.now() - start_time).total_seconds()
+                elapsed_time = clock() - start_time
                 if elapsed_time >= 1.0:
                     print(f"Current FPS: {frame_count/elapsed_time:.2f}")
                     frame_count = 0
-                    start_time = datetime.now()
+                    start_time = clock()
                 
                 try:
                     # Process frame
-                    results = await self.process_frame(frame)
+                    results = await process_frame(frame, lores)
                     
-                    # Convert frame to JPEG with quality setting
-                    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
-                    _, buffer = cv2.imencode('.jpg', frame, encode_param)
-                    base64_frame = base64.b64encode(buffer).decode('utf-8')
+                    # Convert frame to JPEG in the encode pool
+                    jpeg_bytes = await loop.run_in_executor(encode_pool, encode_frame, frame)
                     
-                    # Send frame and results to clients
-                    await self.broadcast_event('frame', {
-                        'image': base64_frame,
-                        'results': results
-                    })
+                    # Hand frame and results to the sender task
+                    queue_frame(jpeg_bytes, results)
                     
                 except Exception as e:
                     print(f"Error processing frame: {e}")
                 
-                await asyncio.sleep(1/30)  # Cap at 30 FPS
+                await sleep(1/30)  # Cap at 30 FPS
                 
         except Exception as e:
             print(f"Error in camera stream: {e}")
             print("Stack trace:", traceback.format_exc())
         finally:
+            if frame_sender:
+                frame_sender.cancel()
             self.stop_camera_stream()
     
+    def _capture_frames(self) -> None:
+        """Read camera frames on the capture thread, keeping only the newest one queued; the camera
+        is released here when the stream stops, so it is never closed in the middle of a read"""
+        camera = self.camera
+        try:
+            while self.running:
+                ret, frame = camera.read()
+                if not ret:
+                    print("Failed to read frame from camera")
+                    # Try to reinitialize camera
+                    camera.release()
+                    try:
+                        self._open_camera()
+                    except Exception as e:
+                        print(f"Failed to reinitialize camera: {e}")
+                        self.running = False
+                        break
+                    camera = self.camera
+                    continue
+                # The low-res luma plane belongs to this frame, so they travel together
+                _put_latest(self._capture_queue, (frame, getattr(camera, 'last_lores', None)))
+        finally:
+            self._release_camera()
+    
+    def _open_camera(self) -> None:
+        """Open the Pi camera through Picamera2 if possible, otherwise a V4L2 camera through OpenCV"""
+        if PICAMERA2_AVAILABLE:
+            try:
+                # libcamera delivers the display frame plus a low-res stream for detection
+                self.camera = PiCamera2Capture()
+                print("Opened Raspberry Pi camera via Picamera2")
+                return
+            except Exception as e:
+                # e.g. picamera2 is installed but only a USB webcam is attached
+                print(f"Picamera2 unavailable ({e}), falling back to OpenCV")
+        self._open_opencv_camera()
+    
+    def _open_opencv_camera(self) -> None:
+        """Open the first available V4L2 camera through OpenCV"""
+        # Try different camera indices
+        for camera_index in [0, 1, 2]:
+            self.camera = cv2.VideoCapture(camera_index)
+            if self.camera.isOpened():
+                print(f"Successfully opened camera at index {camera_index}")
+                break
+            else:
+                print(f"Failed to open camera at index {camera_index}")
+                self.camera.release()
+        
+        if not self.camera.isOpened():
+            raise Exception("Failed to open any camera device")
+        
+        # Get camera properties
+        width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
+        height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        fps = self.camera.get(cv2.CAP_PROP_FPS)
+        print(f"Camera properties - Width: {width}, Height: {height}, FPS: {fps}")
+        
+        # Set camera properties (MJPG avoids the raw YUYV transfer and userspace conversion)
+        self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        self.camera.set(cv2.CAP_PROP_FPS, 30)
+        
+        # Verify settings were applied
+        new_width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
+        new_height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        new_fps = self.camera.get(cv2.CAP_PROP_FPS)
+        print(f"New camera properties - Width: {new_width}, Height: {new_height}, FPS: {new_fps}")
+    
+    def _queue_frame(self, jpeg_bytes: bytes, results: dict) -> None:
+        """Queue a frame for sending, dropping the oldest one if the queue is full"""
+        try:
+            self._frame_queue.put_nowait((jpeg_bytes, results))
+        except asyncio.QueueFull:
+            # Stale frames are worthless for a live view
+            self._frame_queue.get_nowait()
+            self._frame_queue.put_nowait((jpeg_bytes, results))
+    
+    async def _send_queued_frames(self) -> None:
+        """Broadcast queued frames to clients until the stream stops"""
+        while self.running:
+            jpeg_bytes, results = await self._frame_queue.get()
+            # Small JSON header with the results, followed by the raw JPEG as a binary message
+            await self.broadcast_event('frame_meta', {'results': results})
+            websockets.broadcast(self.clients, jpeg_bytes)
+    
+    def _encode_frame_to_jpeg(self, frame) -> bytes:
+        """Encode frame to JPEG bytes (synchronous helper for the encode pool)"""
+        _, buffer = cv2.imencode('.jpg', frame, self.JPEG_ENCODE_PARAMS)
+        return buffer.tobytes()
+    
     def stop_camera_stream(self) -> None:
-        """Stop camera stream"""
+        """Stop camera stream; a running capture thread releases the camera once its current read returns"""
         self.running = False
+        if self._capture_thread is None or not self._capture_thread.is_alive():
+            self._release_camera()
+    
+    def _release_camera(self) -> None:
+        """Release the camera if one is open"""
         if self.camera:
             try:
                 self.camera.release()
@@ -389,7 +932,7 @@ class FaceRecognitionSystem:
         # Send current door status to new client
         await websocket.send(json.dumps({
             'type': 'door_status',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._timestamp(),
             'data': self.door_lock.get_status()
         }))
         
@@ -412,6 +955,10 @@ class FaceRecognitionSystem:
         await self.add_client(websocket)
         try:
             async for message in websocket:
+                # Keepalive pings are by far the most common message; answer them without parsing
+                if message == PING_MESSAGE:
+                    await websocket.send(PONG_MESSAGE)
+                    continue
                 try:
                     data = json.loads(message)
                     
@@ -478,53 +1025,54 @@ class FaceRecognitionSystem:
     
     async def handle_message(self, data: dict) -> Optional[dict]:
         """Handle incoming WebSocket messages"""
-        message_type = data.get('type')
-        
-        if message_type == 'add_user':
-            result = await self.add_user(data['name'], data['image'], data.get('authorized', False))
-            return {'type': 'user_add_response', 'data': result}
-            
-        elif message_type == 'remove_user':
-            result = await self.remove_user(data['name'])
-            return {'type': 'user_remove_response', 'data': result}
-            
-        elif message_type == 'unlock_door':
-            duration = data.get('duration', None)
-            success = self.door_lock.unlock_door(duration)
-            if success:
-                await self.broadcast_event('door_unlocked', {
-                    'user': 'Manual',
-                    'duration': duration or self.door_lock.lock_duration,
-                    'auto_unlock': False
-                })
-            return {'type': 'unlock_response', 'data': {'success': success}}
-            
-        elif message_type == 'lock_door':
-            success = self.door_lock.force_lock()
-            if success:
-                await self.broadcast_event('door_locked', {'manual': True})
-            return {'type': 'lock_response', 'data': {'success': success}}
-            
-        elif message_type == 'get_door_status':
-            return {'type': 'door_status', 'data': self.door_lock.get_status()}
-            
-        elif message_type == 'set_user_authorization':
-            result = await self.set_user_authorization(data['name'], data['authorized'])
-            return {'type': 'authorization_response', 'data': result}
-            
-        elif message_type == 'update_door_config':
-            result = await self.update_door_config(data.get('config', {}))
-            return {'type': 'config_response', 'data': result}
-            
-        elif message_type == 'get_users':
-            users = [{'name': name, 'authorized': name in self.authorized_users} 
-                    for name in self.known_face_names]
-            return {'type': 'users_list', 'data': {'users': users}}
-            
-        elif message_type == 'ping':
-            return {'type': 'pong'}
-            
-        return None
+        handler = self._message_handlers.get(data.get('type'))
+        if handler is None:
+            return None
+        return await handler(data)
+    
+    async def _handle_add_user(self, data: dict) -> dict:
+        result = await self.add_user(data['name'], data['image'], data.get('authorized', False))
+        return {'type': 'user_add_response', 'data': result}
+    
+    async def _handle_remove_user(self, data: dict) -> dict:
+        result = await self.remove_user(data['name'])
+        return {'type': 'user_remove_response', 'data': result}
+    
+    async def _handle_unlock_door(self, data: dict) -> dict:
+        duration = data.get('duration', None)
+        success = self.door_lock.unlock_door(duration)
+        if success:
+            await self.broadcast_event('door_unlocked', {
+                'user': 'Manual',
+                'duration': duration or self.door_lock.lock_duration,
+                'auto_unlock': False
+            })
+        return {'type': 'unlock_response', 'data': {'success': success}}
+    
+    async def _handle_lock_door(self, data: dict) -> dict:
+        success = self.door_lock.force_lock()
+        if success:
+            await self.broadcast_event('door_locked', {'manual': True})
+        return {'type': 'lock_response', 'data': {'success': success}}
+    
+    async def _handle_get_door_status(self, data: dict) -> dict:
+        return {'type': 'door_status', 'data': self.door_lock.get_status()}
+    
+    async def _handle_set_user_authorization(self, data: dict) -> dict:
+        result = await self.set_user_authorization(data['name'], data['authorized'])
+        return {'type': 'authorization_response', 'data': result}
+    
+    async def _handle_update_door_config(self, data: dict) -> dict:
+        result = await self.update_door_config(data.get('config', {}))
+        return {'type': 'config_response', 'data': result}
+    
+    async def _handle_get_users(self, data: dict) -> dict:
+        users = [{'name': name, 'authorized': name in self.authorized_users} 
+                for name in self.known_face_names]
+        return {'type': 'users_list', 'data': {'users': users}}
+    
+    async def _handle_ping(self, data: dict) -> dict:
+        return {'type': 'pong'}
     
     async def add_user(self, name: str, image_data: str, authorized: bool = False) -> dict:
         """Add new user with base64 image data"""
@@ -536,11 +1084,20 @@ class FaceRecognitionSystem:
             rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             
             # Get face encoding
-            face_locations = face_recognition.face_locations(rgb_image, model=self.model)
+            # Enrollment isn't latency sensitive; HOG keeps the DNN net on the recognition thread only
+            face_locations = face_recognition.face_locations(rgb_image, model='cnn' if self.model == 'cnn' else 'hog')
             if len(face_locations) != 1:
                 return {'success': False, 'error': 'Expected one face, found none or multiple'}
             
-            face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+            if self._tflite_encoder is not None:
+                face_encodings = self._tflite_encoder.encode(rgb_image, face_locations)
+            else:
+                face_encodings = face_recognition.face_encodings(
+                    rgb_image,
+                    face_locations,
+                    num_jitters=self.num_jitters,
+                    model=self.landmark_model
+                )
             face_encoding = face_encodings[0]
             
             # Add to known faces
@@ -549,6 +1106,7 @@ class FaceRecognitionSystem:
             
             if authorized:
                 self.authorized_users.add(name)
+            self._rebuild_known_matrix()
             
             self.save_face_data()
             
@@ -570,6 +1128,7 @@ class FaceRecognitionSystem:
                 self.known_face_names.pop(index)
                 self.known_face_encodings.pop(index)
                 self.authorized_users.discard(name)
+                self._rebuild_known_matrix()
                 self.save_face_data()
                 
                 await self.broadcast_event('user_removed', {'name': name})
@@ -590,6 +1149,7 @@ class FaceRecognitionSystem:
                 self.authorized_users.add(name)
             else:
                 self.authorized_users.discard(name)
+            self._rebuild_known_matrix()
             
             self.save_face_data()
             
@@ -630,50 +1190,63 @@ class FaceRecognitionSystem:
         """Log recognition events"""
         try:
             log_entry = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': self._timestamp(),
                 'name': name,
                 'confidence': confidence,
                 'is_authorized': is_authorized,
                 'door_unlocked': self.door_lock.is_unlocked
             }
 
-            # Load existing logs
-            logs = []
-            if os.path.exists(self.log_file):
-                try:
-                    with open(self.log_file, 'r') as f:
-                        # Check if file is empty before loading JSON
-                        content = f.read()
-                        if content:
-                            logs = json.loads(content)
-                        else:
-                            print(f"Log file {self.log_file} is empty. Starting with empty log.")
-                except json.JSONDecodeError:
-                    print(f"Error decoding JSON from {self.log_file}. Starting with empty log.")
-                    logs = [] # Initialize with empty list on error
-                except Exception as e:
-                    print(f"Unexpected error reading log file {self.log_file}: {e}")
-                    logs = [] # Initialize with empty list on error
-
-            # Add new entry and keep last 1000
-            logs.append(log_entry)
-            logs = logs[-1000:]
-
-            # Save logs
-            with open(self.log_file, 'w') as f:
-                json.dump(logs, f, indent=2)
+            # Append a single line instead of rewriting the whole log
+            await asyncio.get_event_loop().run_in_executor(
+                None,
+                self._append_log_line,
+                json.dumps(log_entry)
+            )
 
             # Broadcast recognition event
             await self.broadcast_event('recognition', log_entry)
 
         except Exception as e:
-            # This catch is for errors *during* logging after initial load attempt
             print(f"Error logging recognition: {e}")
     
+    def _append_log_line(self, line: str) -> None:
+        """Append one JSON line to the recognition log, trimming it every max_log_entries appends"""
+        with self._log_lock:
+            with open(self.log_file, 'a') as f:
+                f.write(line + '\n')
+            self._log_appends += 1
+            if self._log_appends >= self.max_log_entries:
+                self.trim_log_file()
+    
+    def trim_log_file(self) -> None:
+        """Keep only the last max_log_entries lines of the recognition log"""
+        self._log_appends = 0
+        if not os.path.exists(self.log_file):
+            return
+        try:
+            with open(self.log_file, 'r') as f:
+                total = 0
+                lines = deque(maxlen=self.max_log_entries)
+                for line in f:
+                    lines.append(line)
+                    total += 1
+            if total > self.max_log_entries:
+                with open(self.log_file, 'w') as f:
+                    f.writelines(lines)
+                print(f"Trimmed recognition log to last {self.max_log_entries} entries")
+        except Exception as e:
+            print(f"Error trimming log file {self.log_file}: {e}")
+    
     def cleanup(self):
         """Cleanup resources"""
         print("Cleaning up resources...")
         self.stop_camera_stream()
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout=1)
+        self._recognition_pool.shutdown(wait=False)
+        self._face_pool.shutdown(wait=False)
+        self._encode_pool.shutdown(wait=False)
         self.door_lock.cleanup()
 
 async def main():
@@ -13,14 +13,236 @@ import json
 import asyncio
 import websockets
 import base64
+from collections import deque
+from functools import lru_cache
 from datetime import datetime, timedelta
 from aiohttp import web
 from typing import Dict, List, Optional, Set
 import traceback
+import shutil
 import RPi.GPIO as GPIO
 import threading
 import time
-import psutil  # For monitoring system resources
+import math
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import re
+import signal
+
+try:
+    import psutil  # For monitoring system resources; adaptive quality needs it
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+try:
+    import orjson  # Faster JSON parsing/serialization when available
+    _json_loads = orjson.loads
+    
+    def _json_dumps(obj) -> str:
+        # Messages must stay text frames; the app treats binary frames as JPEG video
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
+try:
+    import uvloop  # Faster event loop for the WebSocket server when available
+except ImportError:
+    uvloop = None
+
+try:
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    Gst.init(None)
+    GST_AVAILABLE = True
+except (ImportError, ValueError):
+    GST_AVAILABLE = False
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420  # libjpeg-turbo bindings (PyTurboJPEG)
+    TURBOJPEG_AVAILABLE = True
+except ImportError:
+    TURBOJPEG_AVAILABLE = False
+
+_INDICATOR_RADIUS = 8  # Authorization dot drawn in the corner of recognized faces' boxes
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _nearest_quantized(known_q, known_q_sq_norms, query_q):
+        """Index of the nearest int8 row, accumulating dot products straight from the int8 data"""
+        best_index = 0
+        best = 1 << 62
+        for i in range(known_q.shape[0]):
+            dot = 0
+            for j in range(known_q.shape[1]):
+                dot += known_q[i, j] * query_q[j]
+            d = known_q_sq_norms[i] - 2 * dot
+            if d < best:
+                best = d
+                best_index = i
+        return best_index
+    
+    @njit(cache=True)
+    def _annotation_geometry(boxes, text_sizes, width, height):
+        """Per face (boxes rows: top, right, bottom, left; text_sizes rows: width, height, baseline):
+        clipped box, label y, label background top/right/bottom and indicator centre"""
+        geometry = np.empty((boxes.shape[0], 10), dtype=np.int32)
+        for i in range(boxes.shape[0]):
+            top = max(0, boxes[i, 0])
+            right = min(width, boxes[i, 1])
+            bottom = min(height, boxes[i, 2])
+            left = max(0, boxes[i, 3])
+            text_height = text_sizes[i, 1]
+            baseline = text_sizes[i, 2]
+            
+            # Label above the box, or below it if it would leave the frame
+            text_y = top - 10
+            if text_y < text_height + baseline:
+                text_y = bottom + text_height + 10
+            
+            geometry[i, 0] = top
+            geometry[i, 1] = right
+            geometry[i, 2] = bottom
+            geometry[i, 3] = left
+            geometry[i, 4] = text_y
+            geometry[i, 5] = text_y - text_height - baseline
+            geometry[i, 6] = left + text_sizes[i, 0]
+            geometry[i, 7] = text_y + baseline
+            geometry[i, 8] = right - _INDICATOR_RADIUS - 5
+            geometry[i, 9] = top + _INDICATOR_RADIUS + 5
+        return geometry
+else:
+    def _nearest_quantized(known_q, known_q_sq_norms, query_q):
+        """Index of the nearest int8 row"""
+        return int(np.argmin(known_q_sq_norms - 2 * (known_q @ query_q)))
+    
+    def _annotation_geometry(boxes, text_sizes, width, height):
+        """Per face (boxes rows: top, right, bottom, left; text_sizes rows: width, height, baseline):
+        clipped box, label y, label background top/right/bottom and indicator centre"""
+        top = np.maximum(boxes[:, 0], 0)
+        right = np.minimum(boxes[:, 1], width)
+        bottom = np.minimum(boxes[:, 2], height)
+        left = np.maximum(boxes[:, 3], 0)
+        text_width, text_height, baseline = text_sizes.T
+        
+        # Label above the box, or below it if it would leave the frame
+        text_y = top - 10
+        text_y = np.where(text_y < text_height + baseline, bottom + text_height + 10, text_y)
+        
+        return np.stack([
+            top, right, bottom, left,
+            text_y, text_y - text_height - baseline, left + text_width, text_y + baseline,
+            right - _INDICATOR_RADIUS - 5, top + _INDICATOR_RADIUS + 5
+        ], axis=1).astype(np.int32)
+
+@lru_cache(maxsize=256)
+def _text_size(text, font_scale, thickness):
+    """cv2.getTextSize for FONT_HERSHEY_SIMPLEX, cached since labels repeat from frame to frame"""
+    return cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+
+@lru_cache(maxsize=128)
+def _accuracy_badge(text):
+    """The bottom-right accuracy badge (white text on black) rendered once per text"""
+    (text_width, text_height), baseline = _text_size(text, 0.8, 2)
+    badge = np.zeros((text_height + 2 * baseline + 11, text_width + 21, 3), dtype=np.uint8)
+    cv2.putText(badge, text, (10, text_height + baseline + 5),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    badge.setflags(write=False)
+    return badge
+
+def _blit(frame, patch, x, y):
+    """Copy patch onto frame with its top-left corner at (x, y), clipped to the frame"""
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + patch.shape[1], frame.shape[1]), min(y + patch.shape[0], frame.shape[0])
+    if x0 < x1 and y0 < y1:
+        frame[y0:y1, x0:x1] = patch[y0 - y:y1 - y, x0 - x:x1 - x]
+
+# Runs of base64 characters long enough to be image data
+_B64_RE = re.compile(r'[A-Za-z0-9+/=]{100,}')
+
+def _put_latest(q: queue.Queue, item) -> None:
+    """Put item into a single-slot queue, replacing an item nobody picked up yet"""
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(item)
+
+def _contains_large_base64(msg) -> bool:
+    """Check if message contains a base64 string longer than 100 characters"""
+    if len(msg) <= 100:
+        return False
+    return _B64_RE.search(msg) is not None
+
+class GstJpegEncoder:
+    """JPEG encoder running in a GStreamer pipeline on a hardware JPEG encoder element"""
+    # Hardware encoders tried in order; software jpegenc is left out since TurboJPEG/cv2 beat it
+    ENCODERS = ('v4l2jpegenc', 'nvjpegenc')
+    
+    @classmethod
+    def find_encoder(cls) -> Optional[str]:
+        """Name of the first hardware encoder element installed, or None"""
+        for element in cls.ENCODERS:
+            if Gst.ElementFactory.find(element) is not None:
+                return element
+        return None
+    
+    def __init__(self, width: int, height: int):
+        element = self.find_encoder()
+        if element is None:
+            raise RuntimeError("No GStreamer hardware JPEG encoder element available")
+        
+        self.element = element
+        self.shape = (height, width, 3)
+        self.pipeline = Gst.parse_launch(
+            f"appsrc name=src is-live=true do-timestamp=true format=time "
+            f"! videoconvert ! {element} name=enc "
+            f"! appsink name=sink sync=false max-buffers=1"
+        )
+        self.src = self.pipeline.get_by_name('src')
+        self.src.set_property('caps', Gst.Caps.from_string(
+            f"video/x-raw,format=BGR,width={width},height={height},framerate=0/1"
+        ))
+        self.encoder = self.pipeline.get_by_name('enc')
+        self.has_quality = self.encoder.find_property('quality') is not None
+        self.sink = self.pipeline.get_by_name('sink')
+        self.pipeline.set_state(Gst.State.PLAYING)
+    
+    def encode(self, frame, quality: int) -> Optional[bytes]:
+        """Encode one BGR frame, returning the JPEG bytes or None on timeout"""
+        if self.has_quality:
+            self.encoder.set_property('quality', quality)
+        self.src.emit('push-buffer', Gst.Buffer.new_wrapped(frame.tobytes()))
+        sample = self.sink.emit('try-pull-sample', Gst.SECOND)
+        if sample is None:
+            return None
+        buffer = sample.get_buffer()
+        return buffer.extract_dup(0, buffer.get_size())
+    
+    def close(self) -> None:
+        self.pipeline.set_state(Gst.State.NULL)
+
+class ClientOutbox:
+    """Messages waiting for one client's writer task. Control events are never dropped; stream
+    frames are kept as (frame_meta, JPEG) pairs, dropping the oldest pair once max_frames are waiting"""
+    def __init__(self, max_frames: int):
+        self.events = deque()  # Serialized control events
+        self.frames = deque(maxlen=max_frames)  # (serialized frame_meta or None, JPEG bytes)
+        self.ready = asyncio.Event()  # Set whenever something is queued
 
 class DoorLockController:
     def __init__(self, relay_pin=12, lock_duration=5):
@@ -32,7 +254,7 @@ class DoorLockController:
         self.relay_pin = relay_pin
         self.lock_duration = lock_duration
         self.is_unlocked = False
-        self.unlock_timer = None
+        self._relock_handle = None  # Event loop timer that locks the door again after an unlock
         
         # Setup GPIO
         GPIO.setmode(GPIO.BCM)
@@ -50,9 +272,11 @@ class DoorLockController:
             duration = self.lock_duration
             
         try:
+            # The relock timer runs on the event loop; get it before touching the relay
+            loop = asyncio.get_running_loop()
+            
             # Cancel existing timer if running
-            if self.unlock_timer and self.unlock_timer.is_alive():
-                self.unlock_timer.cancel()
+            self._cancel_relock()
             
             # Activate relay (unlock door)
             GPIO.output(self.relay_pin, GPIO.HIGH)
@@ -60,8 +284,7 @@ class DoorLockController:
             print(f"Door unlocked for {duration} seconds")
             
             # Set timer to lock door again
-            self.unlock_timer = threading.Timer(duration, self._lock_door)
-            self.unlock_timer.start()
+            self._relock_handle = loop.call_later(duration, self._lock_door)
             
             return True
             
@@ -71,6 +294,7 @@ class DoorLockController:
     
     def _lock_door(self):
         """Internal method to lock door (called by timer)"""
+        self._relock_handle = None
         try:
             GPIO.output(self.relay_pin, GPIO.LOW)
             self.is_unlocked = False
@@ -81,8 +305,7 @@ class DoorLockController:
     def force_lock(self):
         """Manually lock door immediately"""
         try:
-            if self.unlock_timer and self.unlock_timer.is_alive():
-                self.unlock_timer.cancel()
+            self._cancel_relock()
             
             GPIO.output(self.relay_pin, GPIO.LOW)
             self.is_unlocked = False
@@ -93,6 +316,12 @@ class DoorLockController:
             print(f"Error force locking door: {e}")
             return False
     
+    def _cancel_relock(self):
+        """Cancel a pending automatic lock, if any"""
+        if self._relock_handle is not None:
+            self._relock_handle.cancel()
+            self._relock_handle = None
+    
     def get_status(self):
         """Get current door lock status"""
         return {
@@ -104,15 +333,143 @@ class DoorLockController:
     def cleanup(self):
         """Cleanup GPIO resources"""
         try:
-            if self.unlock_timer and self.unlock_timer.is_alive():
-                self.unlock_timer.cancel()
+            self._cancel_relock()
             GPIO.output(self.relay_pin, GPIO.LOW)  # Ensure door is locked
             GPIO.cleanup()
             print("Door lock controller cleaned up")
         except Exception as e:
             print(f"Error cleaning up door lock controller: {e}")
 
+def _pin_thread_to_cpus(cpus) -> None:
+    """Pin the calling thread (or worker process) to the given CPU cores that exist here; no-op where unsupported"""
+    try:
+        available = set(cpus) & os.sched_getaffinity(0)
+        if available:
+            os.sched_setaffinity(0, available)
+    except (AttributeError, OSError) as e:
+        print(f"Could not pin thread to CPUs {sorted(cpus)}: {e}")
+
+# Shared memory frame slots, attached once in each recognition worker process
+_worker_frame_slots = []
+_worker_rgb_scratch = None  # Reused downsampled RGB detection frame
+_worker_face_cascade = None  # Haar cascade used as a cheap face-presence check before dlib
+
+def _load_face_cascade():
+    """Haar frontal face cascade from the OpenCV install, or None if it can't be found"""
+    directories = ['/usr/share/opencv4/haarcascades']
+    if hasattr(cv2, 'data'):
+        directories.insert(0, cv2.data.haarcascades)  # pip opencv-python ships its own copy
+    for directory in directories:
+        path = os.path.join(directory, 'haarcascade_frontalface_default.xml')
+        if os.path.exists(path):
+            cascade = cv2.CascadeClassifier(path)
+            if not cascade.empty():
+                return cascade
+    return None
+
+def _init_recognition_worker(slot_names, cpus):
+    """Attach a recognition worker process to the shared memory frame slots and pin it to cpus"""
+    global _worker_frame_slots, _worker_face_cascade
+    _worker_frame_slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    _worker_face_cascade = _load_face_cascade()
+    _pin_thread_to_cpus(cpus)
+    try:
+        os.nice(-5)  # Only works with CAP_SYS_NICE (e.g. running as root under systemd)
+    except OSError:
+        pass
+
+def _detect_and_encode(slot, shape, step, model, presence_gate=False, min_face_size=0):
+    """Detect and encode faces in the frame held in a shared memory slot, downsampled
+    by step (runs in a worker process); faces smaller than min_face_size px are dropped"""
+    global _worker_rgb_scratch
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=_worker_frame_slots[slot].buf)
+    
+    if presence_gate and _worker_face_cascade is not None:
+        # Haar pass on a gray frame at the scale HOG sees after its 2x upsample, far
+        # cheaper than HOG; with nothing face-like in view (the usual case at a door)
+        # dlib is skipped entirely. Its minimum size is half HOG's 80px window
+        gate_size = (max(1, shape[1] * 2 // step), max(1, shape[0] * 2 // step))
+        gray = cv2.cvtColor(cv2.resize(frame, gate_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        candidates = _worker_face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=2, minSize=(40, 40))
+        if len(candidates) == 0:
+            del frame
+            return [], []
+    
+    # Nearest-neighbour downsample and BGR->RGB as strided views, copied in one
+    # pass into a buffer reused across frames (same result as INTER_NEAREST + cvtColor)
+    small_bgr = frame[::step, ::step]
+    if _worker_rgb_scratch is None or _worker_rgb_scratch.shape != small_bgr.shape:
+        _worker_rgb_scratch = np.empty(small_bgr.shape, dtype=np.uint8)
+    np.copyto(_worker_rgb_scratch, small_bgr[:, :, ::-1])
+    rgb_small_frame = _worker_rgb_scratch
+    del frame, small_bgr  # Release the views on the slot
+    
+    face_locations = face_recognition.face_locations(rgb_small_frame, model=model)
+    if min_face_size > 0:
+        # Faces too far away to unlock for aren't worth a face_encodings pass
+        min_area = (min_face_size / step) ** 2
+        face_locations = [
+            (top, right, bottom, left) for top, right, bottom, left in face_locations
+            if (right - left) * (bottom - top) >= min_area
+        ]
+    if face_locations:
+        # One float32 (N,128) array: matched in float32 and half the size to pickle back
+        face_encodings = np.asarray(
+            face_recognition.face_encodings(rgb_small_frame, face_locations), dtype=np.float32
+        )
+    else:
+        face_encodings = []
+    return face_locations, face_encodings
+
+def _detect_and_encode_full(slot, shape, detect_step, model):
+    """Detect faces in the slot's frame downsampled by detect_step and encode a single face
+    at full resolution, for user photos (runs in a worker process). Returns (face locations,
+    float32 encoding), the encoding None unless exactly one face was found"""
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=_worker_frame_slots[slot].buf)
+    
+    # Detection time scales with pixel count; faces small enough to be missed
+    # on a downscaled frame fail the enrollment size check anyway
+    small = frame if detect_step == 1 else cv2.resize(frame, (shape[1] // detect_step, shape[0] // detect_step))
+    if model == 'hog':
+        # dlib's HOG detector works on one channel, so grayscale is all it needs
+        detect_image = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    else:
+        detect_image = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    del small
+    face_locations = [
+        (top * detect_step, right * detect_step, bottom * detect_step, left * detect_step)
+        for top, right, bottom, left in face_recognition.face_locations(detect_image, model=model)
+    ]
+    if len(face_locations) != 1:
+        del frame  # Release the view on the slot
+        return face_locations, None
+    
+    # Only the area around the face is converted to RGB for encoding, with a margin
+    # of one face size on each side so the aligned face chip stays inside it
+    top, right, bottom, left = face_locations[0]
+    margin = max(bottom - top, right - left)
+    y0, x0 = max(top - margin, 0), max(left - margin, 0)
+    y1, x1 = min(bottom + margin, shape[0]), min(right + margin, shape[1])
+    face_rgb = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+    del frame  # Release the view on the slot
+    
+    face_encodings = face_recognition.face_encodings(face_rgb, [(top - y0, right - x0, bottom - y0, left - x0)])
+    if not face_encodings:
+        return face_locations, None
+    return face_locations, np.asarray(face_encodings[0], dtype=np.float32)
+
 class FaceRecognitionSystem:
+    LOAD_SAMPLE_INTERVAL = 1.0  # Seconds between CPU/memory samples in adjust_quality_based_on_load
+    MAX_CLIENT_FRAMES = 3  # Stream frames waiting for a client's writer; beyond this the oldest is dropped
+    MAX_BATCH_EVENTS = 64  # Events coalesced into one 'batch' message at most
+    SAVE_DELAY = 0.5  # Seconds to wait for further changes before writing face data/config to disk
+    PHOTO_JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 85]  # cv2.imencode parameters for user/webcam photos
+    FACE_HOLD_FRAMES = 30  # Keep streaming this many frames after the last detected face
+    FRAME_SLOT_SIZE = (640, 480)  # Width, height each shared memory frame slot holds (camera resolution)
+    # Core 0 is left to the event loop and capture thread (keep RASPBERRY_PI_AUTOSTART_SETUP.md's isolcpus in step)
+    ENCODE_CPUS = {1}  # Annotation + JPEG encode thread
+    RECOGNITION_CPUS = {2, 3}  # Recognition worker processes
+    
     def __init__(self, tolerance=0.4, model='hog', auto_unlock=True, unlock_confidence=0.5):
         """
         Initialize face recognition system
@@ -123,18 +480,33 @@ class FaceRecognitionSystem:
         """
         self.tolerance = tolerance
         self.model = model
+        self.presence_gate = True  # Skip HOG on frames where a Haar cascade finds no face-like region
         self.auto_unlock = auto_unlock
         self.unlock_confidence = unlock_confidence
-        self.known_face_encodings = []
         self.known_face_names = []
+        self._known_matrix = np.empty((0, 128), dtype=np.float32)  # Known encodings, one float32 row per known_face_names entry
+        self._authorized_mask = np.zeros(0, dtype=bool)  # Per-row authorization aligned with _known_matrix
+        self._name_index = {}  # Name -> its first row in known_face_names, rebuilt with _authorized_mask
         self.authorized_users = set()  # Users authorized to unlock door
         self.user_photos = {}  # Store user profile photos
-        self.data_file = 'face_data.pkl'
-        self.log_file = 'recognition_log.json'
+        self._users_cache = None  # get_users list, rebuilt after users/authorizations change
+        self.data_file = 'face_data.npz'
+        self.legacy_data_file = 'face_data.pkl'  # Pickle format used before face_data.npz; migrated on load
+        self.photos_dir = 'user_photos'  # One JPEG per user
+        self.log_file = 'recognition_log.jsonl'  # One JSON entry per line, append-only
+        self.max_log_entries = 1000
+        self._log_appends = 0  # Lines appended since the log was last trimmed
+        self._log_lock = threading.Lock()  # Appends run on executor threads
         self.config_file = 'door_config.json'
+        self.debug_logging = bool(os.getenv('WS_DEBUG'))  # Pretty-print full WebSocket message bodies
         self.clients: Set[websockets.WebSocketServerProtocol] = set()
+        self._client_outboxes: Dict[websockets.WebSocketServerProtocol, ClientOutbox] = {}  # Outgoing messages per client
+        self._client_writers: Dict[websockets.WebSocketServerProtocol, asyncio.Task] = {}
         self.camera = None
+        self._camera_lock = asyncio.Lock()  # Serializes _ensure_camera so concurrent handlers open the camera once
+        self._camera_index = None  # Index the camera was last opened at
         self.running = False
+        self._stream_stopping = None  # Future for a stream teardown still running on an executor thread
         
         # Performance settings
         self.target_fps = 10  # Lower target FPS to reduce CPU load
@@ -145,6 +517,83 @@ class FaceRecognitionSystem:
         self.jpeg_quality = 60  # Lower quality for better network performance
         self.max_width = 320  # Smaller frame size for better performance
         self.adaptive_quality = True  # Dynamically adjust quality based on system load
+        self.min_face_size = 0  # Ignore faces narrower than this many captured pixels (0 = keep all)
+        self._last_load_sample = (float('-inf'), 0.0, 0.0)  # (monotonic time, cpu %, memory %)
+        self._jpeg_params_cache = {}  # JPEG quality -> cv2.imencode parameter list
+        # Encode stream frames with GstJpegEncoder only when a hardware encoder element exists,
+        # falling back to TurboJPEG or cv2.imencode
+        self.use_gstreamer = GST_AVAILABLE and GstJpegEncoder.find_encoder() is not None
+        self._gst_encoder = None  # Created by the encode thread for the first frame size it sees
+        self._turbo_jpeg = None  # Software encoder used when GStreamer is unavailable, before cv2.imencode
+        if TURBOJPEG_AVAILABLE:
+            try:
+                self._turbo_jpeg = TurboJPEG()
+            except OSError as e:
+                print(f"libjpeg-turbo could not be loaded, using OpenCV for JPEG encoding: {e}")
+        self._last_results = {'faces': []}  # Latest recognition results, reused between recognition frames
+        self._last_face_arrays = self._face_arrays([])  # Array form of _last_results['faces'] for annotation
+        self._annotation_cache = (None, None, None)  # (face arrays, frame shape, primitives) last drawn
+        self._last_door_status_sent = None  # Lock state last broadcast by the stream loop
+        self._ts_second = None  # Second the cached timestamp prefix was formatted for
+        self._ts_prefix = ''
+        
+        # Idle-scene gate: frames are not encoded/sent while the scene is static and empty
+        self.motion_threshold = 3.0  # Mean absolute grey-level change (0-255) on an 80x60 thumbnail
+        self._prev_gray = None
+        self._frames_since_face = self.FACE_HOLD_FRAMES + 1
+        self._send_next_frame = True  # Set when a client connects so it always gets a first frame
+        self._last_keepalive = 0.0
+        if PSUTIL_AVAILABLE:
+            psutil.cpu_percent(interval=None)  # Prime the counter; the first non-blocking call always returns 0.0
+        else:
+            print("psutil not installed, streaming at fixed JPEG quality")
+        
+        # Frame capture thread and its single-slot handoff queue
+        self._capture_thread = None
+        self._capture_queue = None
+        self._snapshot_wanted = threading.Event()  # Set by _read_frame; the capture thread answers with a copy
+        self._snapshot_ready = threading.Event()
+        self._snapshot = None
+        self._spare_frames = deque(maxlen=2)  # Frame buffers the encode thread is done with, reused by retrieve()
+        
+        # Annotation + JPEG encoding thread, fed the newest frame to send
+        self._encode_thread = None
+        self._encode_queue = None
+        
+        # Face detection/encoding runs in worker processes so dlib never holds the
+        # event loop's GIL and two frames can be recognized on separate cores;
+        # frames are handed over through shared memory slots
+        self.recognition_workers = 2
+        self._recognition_pool = None
+        self._frame_slots = []
+        self._next_frame_slot = 0
+        
+        # Enrollment photo JPEG/base64 encoding and decoding, kept off the event loop
+        self.encode_pool = ThreadPoolExecutor(max_workers=2)
+        
+        # Debounced face data/config writes; a single thread keeps writes to a file in order
+        self._save_pool = ThreadPoolExecutor(max_workers=1)
+        self._save_handle = None  # asyncio.TimerHandle of the pending save
+        self._face_data_dirty = False
+        self._config_dirty = False
+        
+        # Message type -> handler, looked up once per message in handle_message
+        self._message_handlers = {
+            'add_user': self._handle_add_user,
+            'remove_user': self._handle_remove_user,
+            'unlock_door': self._handle_unlock_door,
+            'lock_door': self._handle_lock_door,
+            'get_door_status': self._handle_get_door_status,
+            'set_user_authorization': self._handle_set_user_authorization,
+            'update_door_config': self._handle_update_door_config,
+            'get_users': self._handle_get_users,
+            'ping': self._handle_ping,
+            'update_performance_settings': self._handle_update_performance_settings,
+            'capture_webcam_photo': self._handle_capture_webcam_photo,
+            'add_user_from_webcam': self._handle_add_user_from_webcam,
+            'reboot_system': self._handle_reboot_system,
+            'reset_face_data': self._handle_reset_face_data
+        }
         
         # Client bandwidth tracking
         self.client_bandwidth = {}  # Track bandwidth per client
@@ -157,6 +606,7 @@ class FaceRecognitionSystem:
         # Load existing face data and config
         self.load_face_data()
         self.load_config()
+        self.trim_log_file()
         
         # Print initial configuration for debugging
         print(f"🔧 Initial configuration:")
@@ -168,77 +618,170 @@ class FaceRecognitionSystem:
         print(f"   Door lock pin: {self.door_lock.relay_pin}")
     
     def load_face_data(self) -> None:
-        """Load previously saved face encodings and names"""
+        """Load previously saved face encodings, names and photos"""
+        if not os.path.exists(self.data_file) and os.path.exists(self.legacy_data_file):
+            self._migrate_legacy_face_data()
+            return
+        
         if os.path.exists(self.data_file):
             try:
-                with open(self.data_file, 'rb') as f:
-                    data = pickle.load(f)
-                    self.known_face_encodings = data['encodings']
-                    self.known_face_names = data['names']
-                    # Load authorized users if available
-                    if 'authorized_users' in data:
-                        self.authorized_users = set(data['authorized_users'])
+                with np.load(self.data_file, allow_pickle=False) as data:
+                    self.known_face_names = [str(name) for name in data['names']]
+                    self.authorized_users = set(str(name) for name in data['authorized'])
+                    self._set_known_encodings(data['encodings'])
+                self.user_photos = self._load_user_photos()
                 print(f"Loaded {len(self.known_face_names)} known faces")
                 print(f"Authorized users: {list(self.authorized_users)}")
             except Exception as e:
                 print(f"Error loading face data: {e}")
-                self.known_face_encodings = []
                 self.known_face_names = []
                 self.authorized_users = set()
+                self.user_photos = {}
+                self._set_known_encodings([])
+        else:
+            self._set_known_encodings([])
+    
+    def _migrate_legacy_face_data(self) -> None:
+        """Convert a pickled face data file to the .npz + photo directory format"""
+        try:
+            with open(self.legacy_data_file, 'rb') as f:
+                data = pickle.load(f)
+            self.known_face_names = data['names']
+            self.authorized_users = set(data.get('authorized_users', []))
+            self.user_photos = data.get('photos', {})
+            self._set_known_encodings(data['encodings'])
+            
+            for name, photo in self.user_photos.items():
+                self._save_user_photo(name, photo)
+            self.save_face_data()
+            print(f"Migrated {len(self.known_face_names)} faces from {self.legacy_data_file} to {self.data_file}")
+        except Exception as e:
+            print(f"Error migrating legacy face data: {e}")
+            self.known_face_names = []
+            self.authorized_users = set()
+            self.user_photos = {}
+            self._set_known_encodings([])
     
     def save_face_data(self) -> None:
-        """Save face encodings and names to file"""
+        """Save face encodings, names and authorized users to file"""
+        self._write_face_data(self._face_data_snapshot())
+    
+    def _face_data_snapshot(self) -> dict:
+        """Arrays written by save_face_data (taken on the event loop, written on a thread)"""
+        return {
+            'encodings': self._known_matrix,
+            'names': np.array(self.known_face_names, dtype=str),
+            'authorized': np.array(sorted(self.authorized_users), dtype=str)
+        }
+    
+    def _write_face_data(self, arrays: dict) -> None:
+        """Write a face data snapshot to data_file"""
         try:
-            data = {
-                'encodings': self.known_face_encodings,
-                'names': self.known_face_names,
-                'authorized_users': list(self.authorized_users)
-            }
-            with open(self.data_file, 'wb') as f:
-                pickle.dump(data, f)
-            print(f"Saved {len(self.known_face_names)} faces to {self.data_file}")
+            np.savez(self.data_file, **arrays)
+            print(f"Saved {len(arrays['names'])} faces to {self.data_file}")
         except Exception as e:
             print(f"Error saving face data: {e}")
 
     def save_face_data_with_photos(self) -> None:
-        """Save face encodings, names, and photos to file"""
+        """Save face data; photos are written to photos_dir as they are added"""
+        self.save_face_data()
+    
+    def _photo_path(self, name: str) -> str:
+        """Photo file for a user (hex-encoded name, so any user name is a safe file name)"""
+        return os.path.join(self.photos_dir, f"{name.encode('utf-8').hex()}.jpg")
+    
+    def _save_user_photo(self, name: str, photo: str) -> None:
+        """Write a user's data-URL profile photo to photos_dir as a JPEG file"""
         try:
-            data = {
-                'encodings': self.known_face_encodings,
-                'names': self.known_face_names,
-                'authorized_users': list(self.authorized_users),
-                'photos': getattr(self, 'user_photos', {})
-            }
-            with open(self.data_file, 'wb') as f:
-                pickle.dump(data, f)
-            print(f"Saved {len(self.known_face_names)} faces with photos to {self.data_file}")
+            os.makedirs(self.photos_dir, exist_ok=True)
+            with open(self._photo_path(name), 'wb') as f:
+                f.write(base64.b64decode(photo.split(',', 1)[-1]))
         except Exception as e:
-            print(f"Error saving face data with photos: {e}")
-
-    def load_face_data(self) -> None:
-        """Load previously saved face encodings and names"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'rb') as f:
-                    data = pickle.load(f)
-                    self.known_face_encodings = data['encodings']
-                    self.known_face_names = data['names']
-                    # Load authorized users if available
-                    if 'authorized_users' in data:
-                        self.authorized_users = set(data['authorized_users'])
-                    # Load user photos if available
-                    if 'photos' in data:
-                        self.user_photos = data['photos']
-                    else:
-                        self.user_photos = {}
-                print(f"Loaded {len(self.known_face_names)} known faces")
-                print(f"Authorized users: {list(self.authorized_users)}")
-            except Exception as e:
-                print(f"Error loading face data: {e}")
-                self.known_face_encodings = []
-                self.known_face_names = []
-                self.authorized_users = set()
-                self.user_photos = {}
+            print(f"Error saving photo for {name}: {e}")
+    
+    def _delete_user_photo(self, name: str) -> None:
+        """Remove a user's profile photo file if there is one"""
+        self.user_photos.pop(name, None)
+        try:
+            os.remove(self._photo_path(name))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error deleting photo for {name}: {e}")
+    
+    def _load_user_photos(self) -> dict:
+        """Load profile photos of known users from photos_dir as data URLs"""
+        photos = {}
+        for name in self.known_face_names:
+            path = self._photo_path(name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    photos[name] = f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}"
+        return photos
+    
+    def _set_known_encodings(self, encodings) -> None:
+        """Replace all known encodings (any sequence of 128-d vectors)"""
+        self._known_matrix = np.ascontiguousarray(np.reshape(encodings, (-1, 128)), dtype=np.float32)
+        self._rebuild_match_index()
+    
+    def _append_known_encoding(self, encoding) -> None:
+        """Add one encoding as the last row; its name is appended to known_face_names by the caller"""
+        row = np.asarray(encoding, dtype=np.float32).reshape(1, 128)
+        self._known_matrix = np.vstack((self._known_matrix, row))
+        self._rebuild_match_index()
+    
+    def _remove_known_encoding(self, index: int) -> None:
+        """Drop the encoding row at index"""
+        self._known_matrix = np.delete(self._known_matrix, index, axis=0)
+        self._rebuild_match_index()
+    
+    def _rebuild_match_index(self) -> None:
+        """Refresh the quantized copy and authorization mask derived from _known_matrix"""
+        # int8 copy (one scale for the whole matrix) used to find the nearest row with
+        # integer dot products: |k - q|^2 = |k|^2 - 2 k.q + |q|^2, and |q|^2 doesn't change the argmin
+        max_abs = float(np.abs(self._known_matrix).max()) if len(self._known_matrix) else 0.0
+        self._quant_scale = 127.0 / max_abs if max_abs > 0 else 1.0
+        self._known_q = np.round(self._known_matrix * self._quant_scale).astype(np.int8)
+        known_q32 = self._known_q.astype(np.int32)
+        self._known_q_sq_norms = np.einsum('ij,ij->i', known_q32, known_q32)
+        self._rebuild_authorized_mask()
+    
+    def _rebuild_authorized_mask(self) -> None:
+        """Refresh the per-row authorization mask and name index after users or authorizations change"""
+        self._authorized_mask = np.array(
+            [name in self.authorized_users for name in self.known_face_names], dtype=bool
+        )
+        self._name_index = {}
+        for index, name in enumerate(self.known_face_names):
+            self._name_index.setdefault(name, index)
+        self._users_cache = None
+    
+    def _best_match(self, face_encoding):
+        """Return (index, distance) of the closest known encoding"""
+        face_encoding = np.asarray(face_encoding, dtype=np.float32)  # No copy for float32 input
+        
+        # Nearest row from the quantized matrix...
+        query_q = np.clip(np.round(face_encoding * self._quant_scale), -127, 127).astype(np.int32)
+        best_index = int(_nearest_quantized(self._known_q, self._known_q_sq_norms, query_q))
+        
+        # ...then its exact float distance, so tolerance and confidence are unaffected by quantization
+        diff = self._known_matrix[best_index] - face_encoding
+        return best_index, math.sqrt(float(diff @ diff))
+    
+    def _best_matches(self, face_encodings):
+        """Return (indices, distances) arrays of the closest known encoding for each row of face_encodings"""
+        face_encodings = np.asarray(face_encodings, dtype=np.float32)
+        if len(face_encodings) == 1:
+            best_index, best_distance = self._best_match(face_encodings[0])
+            return np.array([best_index]), np.array([best_distance])
+        
+        # Nearest rows for all faces in one integer matmul against the quantized matrix...
+        queries_q = np.clip(np.round(face_encodings * self._quant_scale), -127, 127).astype(np.int32)
+        best_indices = (self._known_q_sq_norms - 2 * (queries_q @ self._known_q.T)).argmin(axis=1)
+        
+        # ...then their exact float distances
+        diffs = self._known_matrix[best_indices] - face_encodings
+        return best_indices, np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
     
     def load_config(self) -> None:
         """Load door configuration"""
@@ -256,6 +799,7 @@ class FaceRecognitionSystem:
                     self.jpeg_quality = config.get('jpeg_quality', self.jpeg_quality)
                     self.max_width = config.get('max_width', self.max_width)
                     self.adaptive_quality = config.get('adaptive_quality', self.adaptive_quality)
+                    self.min_face_size = config.get('min_face_size', self.min_face_size)
                     
                 print(f"Loaded door configuration: auto_unlock={self.auto_unlock}, confidence={self.unlock_confidence}, duration={self.door_lock.lock_duration}")
                 print(f"Performance settings: target_fps={self.target_fps}, recognition_interval={self.recognition_interval}, jpeg_quality={self.jpeg_quality}")
@@ -264,46 +808,151 @@ class FaceRecognitionSystem:
     
     def save_config(self) -> None:
         """Save door configuration"""
+        self._write_config(self._config_snapshot())
+    
+    def _config_snapshot(self) -> dict:
+        """Settings written by save_config"""
+        return {
+            'auto_unlock': self.auto_unlock,
+            'unlock_confidence': self.unlock_confidence,
+            'lock_duration': self.door_lock.lock_duration,
+            'target_fps': self.target_fps,
+            'recognition_interval': self.recognition_interval,
+            'jpeg_quality': self.jpeg_quality,
+            'max_width': self.max_width,
+            'adaptive_quality': self.adaptive_quality,
+            'min_face_size': self.min_face_size
+        }
+    
+    def _write_config(self, config: dict) -> None:
+        """Write a configuration snapshot to config_file"""
         try:
-            config = {
-                'auto_unlock': self.auto_unlock,
-                'unlock_confidence': self.unlock_confidence,
-                'lock_duration': self.door_lock.lock_duration,
-                'target_fps': self.target_fps,
-                'recognition_interval': self.recognition_interval,
-                'jpeg_quality': self.jpeg_quality,
-                'max_width': self.max_width,
-                'adaptive_quality': self.adaptive_quality
-            }
             with open(self.config_file, 'w') as f:
                 json.dump(config, f, indent=2)
             print("Door configuration saved")
         except Exception as e:
             print(f"Error saving config: {e}")
     
+    def schedule_save(self, face_data: bool = False, config: bool = False) -> None:
+        """Save face data and/or config after SAVE_DELAY, coalescing changes made in the meantime"""
+        self._face_data_dirty |= face_data
+        self._config_dirty |= config
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+        self._save_handle = asyncio.get_event_loop().call_later(
+            self.SAVE_DELAY, lambda: asyncio.ensure_future(self._run_pending_saves())
+        )
+    
+    async def _run_pending_saves(self) -> None:
+        """Write pending face data/config on the save thread"""
+        self._save_handle = None
+        loop = asyncio.get_event_loop()
+        if self._face_data_dirty:
+            self._face_data_dirty = False
+            await loop.run_in_executor(self._save_pool, self._write_face_data, self._face_data_snapshot())
+        if self._config_dirty:
+            self._config_dirty = False
+            await loop.run_in_executor(self._save_pool, self._write_config, self._config_snapshot())
+    
+    def flush_pending_saves(self) -> None:
+        """Write any pending debounced save right away (used at shutdown)"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._save_pool.shutdown(wait=True)  # Finish a write already in progress first
+        if self._face_data_dirty:
+            self._face_data_dirty = False
+            self.save_face_data()
+        if self._config_dirty:
+            self._config_dirty = False
+            self.save_config()
+    
+    def _timestamp(self) -> str:
+        """Local ISO-8601 timestamp; the date/time part is only formatted once per second"""
+        now_ns = time.time_ns()
+        second, remainder_ns = divmod(now_ns, 1_000_000_000)
+        if second != self._ts_second:
+            self._ts_second = second
+            self._ts_prefix = datetime.fromtimestamp(second).strftime('%Y-%m-%dT%H:%M:%S')
+        return f"{self._ts_prefix}.{remainder_ns // 1000:06d}"
+    
     async def broadcast_event(self, event_type: str, data: dict) -> None:
         """Broadcast event to all connected clients"""
         if not self.clients:
             return
             
-        message = json.dumps({
+        self._enqueue_for_clients({
             'type': event_type,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._timestamp(),
             'data': data
         })
+    
+    async def broadcast_binary(self, payload: bytes) -> None:
+        """Send the same binary payload to all connected clients (as a stream frame without frame_meta)"""
+        if not self.clients:
+            return
         
-        await asyncio.gather(
-            *[client.send(message) for client in self.clients],
-            return_exceptions=True
-        )
+        self._enqueue_frame_for_clients(None, payload)
+    
+    def _enqueue_for_clients(self, event: dict) -> None:
+        """Queue a control event for every client's writer task; these are never dropped"""
+        if not self._client_outboxes:
+            return
+        message = _json_dumps(event)  # Serialized once here, not once per client
+        
+        for outbox in self._client_outboxes.values():
+            outbox.events.append(message)
+            outbox.ready.set()
+    
+    def _enqueue_frame_for_clients(self, meta: Optional[dict], jpeg_bytes: bytes) -> None:
+        """Queue a stream frame (frame_meta event plus JPEG) for every client's writer task; a client
+        that is behind loses its oldest waiting frame, never a control event or half of a pair"""
+        if not self._client_outboxes:
+            return
+        meta_message = _json_dumps(meta) if meta is not None else None
+        
+        for outbox in self._client_outboxes.values():
+            outbox.frames.append((meta_message, jpeg_bytes))
+            outbox.ready.set()
+    
+    async def _client_writer(self, websocket: websockets.WebSocketServerProtocol, outbox: ClientOutbox) -> None:
+        """Send a client's queued messages, control events first (coalesced into 'batch' messages),
+        then stream frames, each frame_meta directly ahead of its JPEG"""
+        events = outbox.events
+        frames = outbox.frames
+        try:
+            while True:
+                await outbox.ready.wait()
+                outbox.ready.clear()
+                while events or frames:
+                    if events:
+                        batch = [events.popleft() for _ in range(min(len(events), self.MAX_BATCH_EVENTS))]
+                        await websocket.send(self._pack_events(batch))
+                    else:
+                        meta_message, jpeg_bytes = frames.popleft()
+                        if meta_message is not None:
+                            await websocket.send(meta_message)
+                        await websocket.send(jpeg_bytes)
+        except websockets.exceptions.ConnectionClosed:
+            pass  # handle_websocket removes the client
+    
+    @staticmethod
+    def _pack_events(events: list) -> str:
+        """Join already serialized events into one message; a lone event is sent unwrapped"""
+        if len(events) == 1:
+            return events[0]
+        return '{"type":"batch","items":[' + ','.join(events) + ']}'
     
     def adjust_quality_based_on_load(self):
         """Dynamically adjust quality settings based on system load"""
-        if not self.adaptive_quality:
+        if not self.adaptive_quality or not PSUTIL_AVAILABLE:
             return self.jpeg_quality
-            
-        cpu_percent = psutil.cpu_percent()
-        memory_percent = psutil.virtual_memory().percent
+        
+        # Sampling /proc every frame is wasted work; system load is refreshed at most once per LOAD_SAMPLE_INTERVAL
+        now = time.monotonic()
+        if now - self._last_load_sample[0] >= self.LOAD_SAMPLE_INTERVAL:
+            self._last_load_sample = (now, psutil.cpu_percent(interval=None), psutil.virtual_memory().percent)
+        _, cpu_percent, memory_percent = self._last_load_sample
         
         # Adjust quality based on system load
         if cpu_percent > 90 or memory_percent > 90:
@@ -321,13 +970,10 @@ class FaceRecognitionSystem:
     
     async def process_frame(self, frame, force_recognition=False) -> dict:
         """Process a single frame and return recognition results"""
-        loop = asyncio.get_event_loop()
-        
-        # Resize frame if needed (this is quick, can stay in main thread)
-        height, width = frame.shape[:2]
-        if width > self.max_width:
-            scale = self.max_width / width
-            frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+        # The worker downsamples by striding, so the full frame goes over as is: one
+        # step covers the max_width resize and the 1/4 detection scale together
+        width = frame.shape[1]
+        step = max(1, round(4 * width / self.max_width)) if width > self.max_width else 4
         
         # Only perform recognition on certain frames to reduce CPU load
         perform_recognition = force_recognition or (self.frame_count % self.recognition_interval == 0)
@@ -337,46 +983,28 @@ class FaceRecognitionSystem:
         self.frame_count += 1
         
         if perform_recognition:
-            # Resize frame for faster processing (these operations are quick)
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-            
-            # Run CPU-intensive face detection in thread pool
-            face_locations = await loop.run_in_executor(
-                None,  # Uses default ThreadPoolExecutor
-                lambda: face_recognition.face_locations(rgb_small_frame, model=self.model)
+            # Run CPU-intensive face detection and encoding in the recognition pool
+            face_locations, face_encodings = await self._run_in_recognition_pool(
+                _detect_and_encode, frame, step, self.model, self.presence_gate, self.min_face_size
             )
             
-            # Only run encodings if faces are found
-            if face_locations:
-                face_encodings = await loop.run_in_executor(
-                    None,
-                    lambda: face_recognition.face_encodings(rgb_small_frame, face_locations)
-                )
-            else:
-                face_encodings = []
-            
-            for face_encoding, (top, right, bottom, left) in zip(face_encodings, face_locations):
-                # Compare with known faces
-                matches = face_recognition.compare_faces(
-                    self.known_face_encodings, 
-                    face_encoding, 
-                    tolerance=self.tolerance
-                )
+            # Nearest known encoding for every face at once (replaces compare_faces + face_distance)
+            matched = None
+            if len(self._known_matrix) > 0 and len(face_encodings) > 0:
+                best_indices, best_distances = self._best_matches(face_encodings)
+                matched = best_distances <= self.tolerance
+            
+            for i, (top, right, bottom, left) in enumerate(face_locations):
                 name = "Unknown"
                 confidence = 0.0
                 is_authorized = False
                 
-                if len(self.known_face_encodings) > 0:
-                    face_distances = face_recognition.face_distance(
-                        self.known_face_encodings, 
-                        face_encoding
-                    )
-                    best_match_index = np.argmin(face_distances)
-                    if matches[best_match_index]:
+                if matched is not None:
+                    if matched[i]:
+                        best_match_index = int(best_indices[i])
                         name = self.known_face_names[best_match_index]
-                        confidence = float(1 - face_distances[best_match_index])
-                        is_authorized = name in self.authorized_users
+                        confidence = float(1 - best_distances[i])
+                        is_authorized = bool(self._authorized_mask[best_match_index])
                         
                         # Debug logging for auto-unlock
                         print(f"🔍 Face detected: {name}")
@@ -422,55 +1050,153 @@ class FaceRecognitionSystem:
                             # Log recognition event
                             await self.log_recognition(name, confidence, is_authorized)
                 
-                # Scale coordinates back up
+                # Scale coordinates back up to the captured frame
                 results.append({
                     'name': name,
                     'confidence': confidence,
                     'is_authorized': is_authorized,
                     'location': {
-                        'top': top * 4,
-                        'right': right * 4,
-                        'bottom': bottom * 4,
-                        'left': left * 4
+                        'top': top * step,
+                        'right': right * step,
+                        'bottom': bottom * step,
+                        'left': left * step
                     }
                 })
         
+        # Door status isn't repeated in every frame; it is sent as a 'door_status' event when it changes
         return {
             'faces': results,
-            'timestamp': datetime.now().isoformat(),
-            'door_status': self.door_lock.get_status()
+            'timestamp': self._timestamp()
         }
     
+    def _start_recognition_pool(self, slot_size: int) -> None:
+        """Start the recognition worker pool with shared memory frame slots of slot_size bytes,
+        retiring any running pool off the event loop"""
+        self._retire_recognition_pool()
+        
+        # Two slots per worker so a slot is never rewritten while a worker still reads it
+        self._frame_slots = [
+            shared_memory.SharedMemory(create=True, size=slot_size)
+            for _ in range(self.recognition_workers * 2)
+        ]
+        self._next_frame_slot = 0
+        self._recognition_pool = ProcessPoolExecutor(
+            max_workers=self.recognition_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_recognition_worker,
+            initargs=([slot.name for slot in self._frame_slots], self.RECOGNITION_CPUS)
+        )
+        print(f"Started recognition pool with {self.recognition_workers} worker processes")
+    
+    def _stop_recognition_pool(self) -> None:
+        """Shut down the recognition worker pool and free its shared memory slots (blocking)"""
+        pool, slots = self._recognition_pool, self._frame_slots
+        self._recognition_pool = None
+        self._frame_slots = []
+        self._shutdown_recognition_pool(pool, slots)
+    
+    def _retire_recognition_pool(self) -> None:
+        """Detach the recognition pool and shut it down on an executor thread, so the event loop
+        never waits on the join; the next frame starts a fresh pool with new slots"""
+        pool, slots = self._recognition_pool, self._frame_slots
+        self._recognition_pool = None
+        self._frame_slots = []
+        if pool is not None or slots:
+            asyncio.get_event_loop().run_in_executor(None, self._shutdown_recognition_pool, pool, slots)
+    
+    @staticmethod
+    def _shutdown_recognition_pool(pool, slots) -> None:
+        """Join a detached recognition pool, then free its shared memory slots once no worker can still read them"""
+        if pool is not None:
+            try:
+                pool.shutdown(wait=True, cancel_futures=True)
+            except Exception as e:
+                print(f"Error stopping recognition pool: {e}")
+        
+        for slot in slots:
+            try:
+                slot.close()
+                slot.unlink()
+            except Exception as e:
+                print(f"Error releasing frame slot: {e}")
+    
+    async def _run_in_recognition_pool(self, worker_fn, frame, *args):
+        """Run worker_fn(slot, frame.shape, *args) in the recognition pool on a shared memory copy of frame"""
+        slot = self._write_frame_slot(frame)
+        pool = self._recognition_pool
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                pool, worker_fn, slot, frame.shape, *args
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); every call in flight on the pool fails with it,
+            # but only the first to get here retires it and the next frame starts a fresh one
+            if self._recognition_pool is pool:
+                print("Recognition worker died, restarting pool")
+                self._retire_recognition_pool()
+            raise
+    
+    def _write_frame_slot(self, frame) -> int:
+        """Copy frame into the next shared memory slot and return the slot index"""
+        if self._recognition_pool is None or frame.nbytes > self._frame_slots[0].size:
+            width, height = self.FRAME_SLOT_SIZE
+            self._start_recognition_pool(max(frame.nbytes, width * height * 3))
+        
+        slot = self._next_frame_slot
+        self._next_frame_slot = (slot + 1) % len(self._frame_slots)
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=self._frame_slots[slot].buf)[...] = frame
+        return slot
+    
+    def _open_camera_sync(self) -> bool:
+        """Open the camera, trying the index that worked last time first, and apply the
+        capture settings (blocking, so call it from an executor thread)"""
+        indices = [0, 1, 2]
+        if self._camera_index is not None:
+            indices.remove(self._camera_index)
+            indices.insert(0, self._camera_index)
+        
+        for camera_index in indices:
+            camera = cv2.VideoCapture(camera_index)
+            if camera.isOpened():
+                print(f"Successfully opened camera at index {camera_index}")
+                # Compressed MJPG transfer instead of raw YUYV (must be set before the frame size);
+                # frames the capture thread only grab()s are then never decoded at all
+                camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+                camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+                camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimal buffer to reduce lag
+                fourcc = int(camera.get(cv2.CAP_PROP_FOURCC)) & 0xFFFFFFFF
+                print(f"Camera properties - Width: {camera.get(cv2.CAP_PROP_FRAME_WIDTH)}, "
+                      f"Height: {camera.get(cv2.CAP_PROP_FRAME_HEIGHT)}, FPS: {camera.get(cv2.CAP_PROP_FPS)}, "
+                      f"Format: {fourcc.to_bytes(4, 'little').decode('ascii', 'replace')}")
+                self.camera = camera
+                self._camera_index = camera_index
+                return True
+            print(f"Failed to open camera at index {camera_index}")
+            camera.release()
+        return False
+    
+    async def _ensure_camera(self) -> bool:
+        """Make sure the camera is open, opening it off the event loop if needed"""
+        async with self._camera_lock:
+            if self.camera is not None and self.camera.isOpened():
+                return True
+            return await asyncio.get_event_loop().run_in_executor(None, self._open_camera_sync)
+    
     async def start_camera_stream(self) -> None:
         """Start camera stream and recognition with improved performance"""
+        if self._stream_stopping is not None:
+            # Let the previous stream release the camera before opening it again
+            await asyncio.shield(self._stream_stopping)
         if self.running:
             return
             
         try:
-            # Try different camera indices
-            for camera_index in [0, 1, 2]:
-                self.camera = cv2.VideoCapture(camera_index)
-                if self.camera.isOpened():
-                    print(f"Successfully opened camera at index {camera_index}")
-                    break
-                else:
-                    print(f"Failed to open camera at index {camera_index}")
-                    self.camera.release()
-            
-            if not self.camera.isOpened():
+            if not await self._ensure_camera():
                 raise Exception("Failed to open any camera device")
             
-            # Get camera properties
-            width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-            height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
-            fps = self.camera.get(cv2.CAP_PROP_FPS)
-            print(f"Camera properties - Width: {width}, Height: {height}, FPS: {fps}")
-            
             # Set camera properties for optimal performance
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
             self.camera.set(cv2.CAP_PROP_FPS, 30)  # Use camera's native FPS
-            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimal buffer to reduce lag
             
             # Verify settings were applied
             new_width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
@@ -483,62 +1209,69 @@ class FaceRecognitionSystem:
             
             # Initialize frame processing variables  
             frame_count = 0
-            start_time = datetime.now()
-            last_fps_report = time.time()
+            last_fps_report = time.monotonic()
+            loop = asyncio.get_event_loop()
+            
+            # Capture runs on its own thread and keeps only the newest frame, so the
+            # loop below never waits on V4L2 or processes a stale buffered frame
+            self._capture_queue = queue.Queue(maxsize=1)
+            self._capture_thread = threading.Thread(target=self._capture_frames, daemon=True)
+            self._capture_thread.start()
+            
+            # Annotating and encoding frame N on its own thread overlaps with capturing
+            # and recognizing frame N+1 here
+            self._encode_queue = queue.Queue(maxsize=1)
+            self._encode_thread = threading.Thread(target=self._encode_frames, args=(loop,), daemon=True)
+            self._encode_thread.start()
             
             while self.running and self.clients:
-                # Always read from camera to prevent buffer buildup
-                ret, frame = self.camera.read()
-                if not ret:
-                    print("Failed to read frame from camera")
-                    # Try to reinitialize camera
-                    self.camera.release()
-                    await asyncio.sleep(0.1)
-                    self.camera = cv2.VideoCapture(0)
-                    self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                    self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                    self.camera.set(cv2.CAP_PROP_FPS, self.target_fps)  # Match camera FPS to target
-                    self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                    if not self.camera.isOpened():
-                        print("Failed to reinitialize camera, retrying...")
-                        await asyncio.sleep(1)
+                try:
+                    frame = await loop.run_in_executor(None, self._capture_queue.get, True, 0.5)
+                except queue.Empty:
                     continue
                 
                 frame_count += 1
                 
                 try:
                     # Process every frame - no artificial rate limiting
-                    loop = asyncio.get_event_loop()
                     quality = self.adjust_quality_based_on_load()
                     
-                    # Process frame recognition and encoding
-                    results = await self.process_frame(frame)
+                    # Recognize only every recognition_interval frames; frames in between
+                    # skip process_frame entirely and reuse the last results for annotations
+                    if self.frame_count % self.recognition_interval == 0:
+                        results = await self.process_frame(frame)
+                        self._last_results = results
+                        self._last_face_arrays = self._face_arrays(results['faces'])
+                    else:
+                        self.frame_count += 1
+                        results = {
+                            'faces': self._last_results['faces'],
+                            'timestamp': self._timestamp()
+                        }
                     
-                    # Encode frame in thread pool
-                    base64_frame = await loop.run_in_executor(
-                        None,
-                        lambda: self._encode_frame_to_base64(frame, quality, results)
-                    )
+                    await self._broadcast_door_status_if_changed()
                     
-                    if base64_frame:
-                        # Send frame to clients immediately
-                        await self.broadcast_event('frame', {
-                            'image': base64_frame,
-                            'results': results
-                        })
+                    # Static scene with nobody in it: skip encoding/sending and just keep clients alive
+                    if self._is_idle_frame(frame, results):
+                        now = time.monotonic()
+                        if now - self._last_keepalive >= 1.0:
+                            self._last_keepalive = now
+                            await self.broadcast_event('no_change', {})
+                    else:
+                        # Hand the frame to the encode thread, replacing one it hasn't started on
+                        _put_latest(self._encode_queue, (frame, quality, results, self._last_face_arrays))
                     
                 except Exception as e:
                     print(f"Error processing frame: {e}")
                     # Continue with next frame even if this one failed
                 
                 # FPS monitoring every 5 seconds
-                current_time = time.time()
-                if current_time - last_fps_report >= 5.0:
-                    elapsed_time = (datetime.now() - start_time).total_seconds()
+                current_time = time.monotonic()
+                elapsed_time = current_time - last_fps_report
+                if elapsed_time >= 5.0:
                     actual_fps = frame_count / elapsed_time
                     print(f"Streaming at {actual_fps:.1f} FPS")
                     frame_count = 0
-                    start_time = datetime.now()
                     last_fps_report = current_time
                 
                 # Very small yield to prevent blocking event loop completely
@@ -548,35 +1281,196 @@ class FaceRecognitionSystem:
             print(f"Error in camera stream: {e}")
             print("Stack trace:", traceback.format_exc())
         finally:
-            self.stop_camera_stream()
+            await self.stop_camera_stream()
+    
+    async def _broadcast_door_status_if_changed(self) -> None:
+        """Send a door_status event when the lock state differs from the last one sent"""
+        is_unlocked = self.door_lock.is_unlocked
+        if is_unlocked != self._last_door_status_sent:
+            self._last_door_status_sent = is_unlocked
+            await self.broadcast_event('door_status', self.door_lock.get_status())
+    
+    def _is_idle_frame(self, frame, results) -> bool:
+        """True if the scene hasn't changed since the last sent frame and no face was seen recently"""
+        gray = cv2.cvtColor(cv2.resize(frame, (80, 60)), cv2.COLOR_BGR2GRAY)
+        
+        if results['faces']:
+            self._frames_since_face = 0
+        else:
+            self._frames_since_face += 1
+        
+        changed = (
+            self._prev_gray is None or
+            float(cv2.absdiff(gray, self._prev_gray).mean()) >= self.motion_threshold
+        )
+        if (changed or self._frames_since_face <= self.FACE_HOLD_FRAMES
+                or self._send_next_frame):
+            # Compare later frames against the last frame that was actually sent
+            self._prev_gray = gray
+            self._send_next_frame = False
+            return False
+        return True
     
-    def _encode_frame_to_base64(self, frame, quality, results=None):
-        """Encode frame to base64 (synchronous helper for thread pool)"""
+    def _capture_frames(self) -> None:
+        """Read camera frames on the capture thread, keeping only the newest one queued"""
+        while self.running:
+            # Always grab to keep up with the camera, but only decode a frame when
+            # the stream loop has taken the last one or a snapshot is waiting
+            ret = self.camera.grab()
+            frame = None
+            if ret and (self._capture_queue.empty() or self._snapshot_wanted.is_set()):
+                # Decode into a recycled buffer instead of allocating a new frame each time
+                spare = self._spare_frames.pop() if self._spare_frames else None
+                ret, frame = self.camera.retrieve(spare)
+            if not ret:
+                print("Failed to read frame from camera")
+                # Try to reinitialize camera
+                self.camera.release()
+                time.sleep(0.1)
+                if self._open_camera_sync():
+                    self.camera.set(cv2.CAP_PROP_FPS, self.target_fps)  # Match camera FPS to target
+                else:
+                    print("Failed to reinitialize camera, retrying...")
+                    time.sleep(1)
+                continue
+            if frame is None:
+                continue
+            
+            if self._snapshot_wanted.is_set():
+                # The stream draws annotations onto its frames in place, so hand out a clean copy
+                self._snapshot = frame.copy()
+                self._snapshot_wanted.clear()
+                self._snapshot_ready.set()
+            
+            _put_latest(self._capture_queue, frame)
+    
+    def _encode_frames(self, loop) -> None:
+        """Annotate and JPEG-encode frames on the encode thread, handing the results back to the event loop"""
+        _pin_thread_to_cpus(self.ENCODE_CPUS)
+        while self.running:
+            try:
+                frame, quality, results, face_arrays = self._encode_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            jpeg_bytes = self._encode_frame_to_jpeg(frame, quality, results, face_arrays)
+            # Nothing else holds the frame once it is encoded (the JPEG bytes are a copy)
+            self._spare_frames.append(frame)
+            if jpeg_bytes:
+                loop.call_soon_threadsafe(self._send_encoded_frame, results, jpeg_bytes)
+    
+    def _send_encoded_frame(self, results, jpeg_bytes) -> None:
+        """Queue an encoded frame for every client (runs on the event loop)"""
+        if not self.clients:
+            return
+        
+        # Send results as a small JSON message followed by the raw JPEG
+        # as a binary message (no base64 inflation or UTF-8 handling)
+        self._enqueue_frame_for_clients({
+            'type': 'frame_meta',
+            'timestamp': self._timestamp(),
+            'data': {'results': results}
+        }, jpeg_bytes)
+    
+    def _read_frame(self):
+        """Read a fresh frame, asking the capture thread for a copy of its next one while the stream is running
+        (blocks for up to a frame interval, so call it from an executor thread)"""
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            self._snapshot_ready.clear()
+            self._snapshot_wanted.set()
+            if not self._snapshot_ready.wait(timeout=1.0):
+                return False, None
+            return True, self._snapshot
+        
+        # Nobody has been reading the camera, so its buffer holds old frames: grab
+        # (without decoding) past them and decode only the newest
+        for _ in range(3):
+            if not self.camera.grab():
+                return False, None
+        return self.camera.retrieve()
+    
+    def _encode_frame_to_jpeg(self, frame, quality, results=None, face_arrays=None):
+        """Encode annotated frame to JPEG bytes (synchronous helper for thread pool)"""
         try:
             # Use provided results or fallback to empty results
             if results is None:
                 results = {'faces': []}
             
-            # Draw annotations on frame
-            annotated_frame = self.draw_face_annotations(frame, results)
+            # Draw annotations directly on the frame (it is discarded after encoding)
+            self.draw_face_annotations(frame, results, face_arrays)
             
             # Encode to JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
-            ret_encode, buffer = cv2.imencode('.jpg', annotated_frame, encode_param)
+            jpeg_bytes = self._gst_encode(frame, quality)
+            if jpeg_bytes is not None:
+                return jpeg_bytes
+            if self._turbo_jpeg is not None:
+                return self._turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR,
+                                               jpeg_subsample=TJSAMP_420)
+            
+            ret_encode, buffer = cv2.imencode('.jpg', frame, self._jpeg_encode_params(quality))
             
             if ret_encode:
-                # Convert to base64
-                base64_bytes = base64.b64encode(buffer)
-                return base64_bytes.decode('utf-8')
+                return buffer.tobytes()
             else:
                 return None
         except Exception as e:
             print(f"Error encoding frame: {e}")
             return None
     
-    def stop_camera_stream(self) -> None:
-        """Stop camera stream"""
+    def _gst_encode(self, frame, quality: int) -> Optional[bytes]:
+        """Encode through GStreamer, or return None so the caller falls back to cv2.imencode"""
+        if not self.use_gstreamer:
+            return None
+        try:
+            if self._gst_encoder is None or self._gst_encoder.shape != frame.shape:
+                if self._gst_encoder is not None:
+                    self._gst_encoder.close()
+                self._gst_encoder = GstJpegEncoder(frame.shape[1], frame.shape[0])
+                print(f"Using GStreamer {self._gst_encoder.element} for JPEG encoding")
+            return self._gst_encoder.encode(frame, quality)
+        except Exception as e:
+            print(f"GStreamer JPEG encoding failed, using OpenCV instead: {e}")
+            self.use_gstreamer = False
+            return None
+    
+    def _jpeg_encode_params(self, quality: int) -> list:
+        """Baseline JPEG encode parameters tuned for encode speed, cached per quality level"""
+        params = self._jpeg_params_cache.get(quality)
+        if params is None:
+            params = [
+                int(cv2.IMWRITE_JPEG_QUALITY), quality,
+                int(cv2.IMWRITE_JPEG_OPTIMIZE), 0,  # Skip the extra Huffman optimization pass
+                int(cv2.IMWRITE_JPEG_PROGRESSIVE), 0  # Single-scan baseline JPEG
+            ]
+            if hasattr(cv2, 'IMWRITE_JPEG_CHROMA_QUALITY'):
+                # Colour detail matters least in the preview; spend fewer bits on it
+                params += [int(cv2.IMWRITE_JPEG_CHROMA_QUALITY), max(10, quality - 10)]
+            self._jpeg_params_cache[quality] = params
+        return params
+    
+    async def stop_camera_stream(self) -> None:
+        """Stop camera stream, joining its threads and releasing the camera off the event loop"""
+        self.running = False
+        if self._stream_stopping is None or self._stream_stopping.done():
+            self._stream_stopping = asyncio.get_event_loop().run_in_executor(None, self._stop_camera_stream_sync)
+        # Shielded so a cancelled caller doesn't abandon the teardown other callers wait on
+        await asyncio.shield(self._stream_stopping)
+    
+    def _stop_camera_stream_sync(self) -> None:
+        """Stop the capture/encode threads and release the camera (blocking, so call it from an executor thread)"""
         self.running = False
+        if self._encode_thread is not None:
+            if self._encode_thread is not threading.current_thread():
+                self._encode_thread.join(timeout=1)
+            self._encode_thread = None
+        if self._gst_encoder is not None:
+            self._gst_encoder.close()
+            self._gst_encoder = None
+        if self._capture_thread is not None:
+            # Let the capture thread finish its current read before the camera is released
+            if self._capture_thread is not threading.current_thread():
+                self._capture_thread.join(timeout=1)
+            self._capture_thread = None
         if self.camera:
             try:
                 self.camera.release()
@@ -596,12 +1490,20 @@ class FaceRecognitionSystem:
         }
         
         # Send current door status to new client
-        await websocket.send(json.dumps({
+        await websocket.send(_json_dumps({
             'type': 'door_status',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._timestamp(),
             'data': self.door_lock.get_status()
         }))
         
+        # Everything broadcast from here on goes through the client's own writer task
+        outbox = ClientOutbox(self.MAX_CLIENT_FRAMES)
+        self._client_outboxes[websocket] = outbox
+        self._client_writers[websocket] = asyncio.create_task(self._client_writer(websocket, outbox))
+        
+        # Make sure the new client gets a frame even if the scene is idle
+        self._send_next_frame = True
+        
         if len(self.clients) == 1:
             # Start camera stream when first client connects
             asyncio.create_task(self.start_camera_stream())
@@ -609,13 +1511,17 @@ class FaceRecognitionSystem:
     async def remove_client(self, websocket: websockets.WebSocketServerProtocol) -> None:
         """Remove WebSocket client"""
         self.clients.discard(websocket)
+        self._client_outboxes.pop(websocket, None)
+        writer = self._client_writers.pop(websocket, None)
+        if writer is not None:
+            writer.cancel()
         client_ip = websocket.remote_address[0]
         if client_ip in self.client_bandwidth:
             del self.client_bandwidth[client_ip]
             
         if not self.clients:
             # Stop camera stream when last client disconnects
-            self.stop_camera_stream()
+            await self.stop_camera_stream()
     
     async def handle_websocket(self, websocket: websockets.WebSocketServerProtocol) -> None:
         """Handle WebSocket connection"""
@@ -628,50 +1534,27 @@ class FaceRecognitionSystem:
         try:
             async for message in websocket:
                 try:
-                    data = json.loads(message)
+                    data = _json_loads(message)
                     
                     # Clean logging based on message type and content
                     message_type = data.get('type', 'unknown')
                     
-                    # Check if message contains a large base64 string
-                    def contains_large_base64(msg):
-                        if len(msg) <= 100:
-                            return False
-                        
-                        # Look for base64 strings in the message
-                        import re
-                        # Find sequences of base64 characters that are longer than 100 chars
-                        base64_pattern = r'[A-Za-z0-9+/=]{100,}'
-                        matches = re.findall(base64_pattern, msg)
-                        
-                        # Check if any match contains only base64 characters
-                        for match in matches:
-                            base64_chars = set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')
-                            if all(c in base64_chars for c in match):
-                                return True
-                        return False
-                    
-                    # Skip logging for large base64 data or frequent/noisy message types  
+                    # Skip logging for large base64 data or frequent/noisy message types
+                    # (cheap checks first so the regex only sees mid-sized messages)
                     should_skip_logging = (
-                        contains_large_base64(message) or  # Skip messages containing base64 strings >100 chars
-                        message_type in ['ping', 'frame_data'] or  # Skip frequent messages
-                        len(message) > 1000  # Skip very large messages
+                        message_type in ('ping', 'frame_data') or  # Skip frequent messages
+                        len(message) > 1000 or  # Skip very large messages
+                        _contains_large_base64(message)  # Skip messages containing base64 strings >100 chars
                     )
                     
                     if not should_skip_logging:
+                        print(f"\n📨 [{client_ip}] {message_type.upper()}")
+                    
+                    if not should_skip_logging and self.debug_logging:
                         # Pretty print JSON messages for better readability
                         try:
-                            # Create a clean copy for logging (remove large data fields)
-                            log_data = data.copy()
-                            
-                            # Remove or truncate large fields
-                            if 'image' in log_data and len(str(log_data['image'])) > 50:
-                                log_data['image'] = f"[BASE64_IMAGE_{len(str(log_data['image']))}bytes]"
-                            if 'data' in log_data and isinstance(log_data['data'], dict) and 'image' in log_data['data']:
-                                if len(str(log_data['data']['image'])) > 50:
-                                    log_data['data']['image'] = f"[BASE64_IMAGE_{len(str(log_data['data']['image']))}bytes]"
+                            log_data = self._scrub_images_for_log(data)
                             
-                            print(f"\n📨 [{client_ip}] {message_type.upper()}")
                             if len(log_data) > 1 or (len(log_data) == 1 and 'type' not in log_data):
                                 print(f"   📄 {json.dumps(log_data, indent=2)}")
                         except:
@@ -683,19 +1566,17 @@ class FaceRecognitionSystem:
                         # Clean response logging
                         response_type = response.get('type', 'response')
                         if response_type not in ['pong', 'frame']:  # Skip frequent response types
-                            try:
-                                log_response = response.copy()
-                                if 'data' in log_response and isinstance(log_response['data'], dict):
-                                    if 'image' in log_response['data'] and len(str(log_response['data']['image'])) > 50:
-                                        log_response['data']['image'] = f"[BASE64_IMAGE_{len(str(log_response['data']['image']))}bytes]"
-                                
-                                print(f"📤 [{client_ip}] {response_type.upper()}")
-                                if len(log_response) > 1 or (len(log_response) == 1 and 'type' not in log_response):
-                                    print(f"   📄 {json.dumps(log_response, indent=2)}")
-                            except:
-                                print(f"📤 [{client_ip}] {response_type}")
+                            print(f"📤 [{client_ip}] {response_type.upper()}")
+                            if self.debug_logging:
+                                try:
+                                    log_response = self._scrub_images_for_log(response)
+                                    
+                                    if len(log_response) > 1 or (len(log_response) == 1 and 'type' not in log_response):
+                                        print(f"   📄 {json.dumps(log_response, indent=2)}")
+                                except:
+                                    pass
                         
-                        await websocket.send(json.dumps(response))
+                        await websocket.send(_json_dumps(response))
                         
                 except json.JSONDecodeError:
                     print(f"Invalid message format from {client_ip}")
@@ -709,77 +1590,98 @@ class FaceRecognitionSystem:
             await self.remove_client(websocket)
             print(f"Client {client_ip} disconnected")
     
+    @staticmethod
+    def _scrub_images_for_log(message: dict) -> dict:
+        """Message with large 'image' fields replaced by a placeholder; copied only if there is one"""
+        image = message.get('image')
+        top_len = len(image) if isinstance(image, str) else 0
+        inner = message.get('data')
+        inner_image = inner.get('image') if isinstance(inner, dict) else None
+        inner_len = len(inner_image) if isinstance(inner_image, str) else 0
+        if top_len <= 50 and inner_len <= 50:
+            return message
+        
+        log_message = dict(message)
+        if top_len > 50:
+            log_message['image'] = f"[BASE64_IMAGE_{top_len}bytes]"
+        if inner_len > 50:
+            # Copy the nested dict too, so the message being handled keeps its image
+            log_message['data'] = dict(inner, image=f"[BASE64_IMAGE_{inner_len}bytes]")
+        return log_message
+    
     async def handle_message(self, data: dict) -> Optional[dict]:
         """Handle incoming WebSocket messages"""
-        message_type = data.get('type')
-        
-        if message_type == 'add_user':
-            result = await self.add_user(data['name'], data['image'], data.get('authorized', True))
-            return {'type': 'user_added', 'data': result}
-            
-        elif message_type == 'remove_user':
-            # Frontend sends either 'id' or 'name', backend remove_user expects name
-            user_identifier = data.get('id') or data.get('name')
-            result = await self.remove_user(user_identifier)
-            return {'type': 'user_removed', 'data': result}
-            
-        elif message_type == 'unlock_door':
-            duration = data.get('duration', None)
-            success = self.door_lock.unlock_door(duration)
-            if success:
-                await self.broadcast_event('door_unlocked', {
-                    'user': 'Manual',
-                    'duration': duration or self.door_lock.lock_duration,
-                    'auto_unlock': False
-                })
-            return {'type': 'unlock_response', 'data': {'success': success}}
-            
-        elif message_type == 'lock_door':
-            success = self.door_lock.force_lock()
-            if success:
-                await self.broadcast_event('door_locked', {'manual': True})
-            return {'type': 'lock_response', 'data': {'success': success}}
-            
-        elif message_type == 'get_door_status':
-            return {'type': 'door_status', 'data': self.door_lock.get_status()}
-            
-        elif message_type == 'set_user_authorization':
-            result = await self.set_user_authorization(data['name'], data['authorized'])
-            return {'type': 'authorization_response', 'data': result}
-            
-        elif message_type == 'update_door_config':
-            result = await self.update_door_config(data.get('config', {}))
-            return {'type': 'config_response', 'data': result}
-            
-        elif message_type == 'get_users':
-            users = [{'name': name, 'authorized': name in self.authorized_users, 'photo': self.user_photos.get(name, '')} 
-                    for name in self.known_face_names]
-            return {'type': 'users_list', 'data': {'users': users}}
-            
-        elif message_type == 'ping':
-            return {'type': 'pong'}
-            
-        elif message_type == 'update_performance_settings':
-            result = await self.update_performance_settings(data.get('settings', {}))
-            return {'type': 'performance_settings_response', 'data': result}
-            
-        elif message_type == 'capture_webcam_photo':
-            result = await self.capture_webcam_photo()
-            return {'type': 'webcam_capture_response', 'data': result}
-            
-        elif message_type == 'add_user_from_webcam':
-            result = await self.add_user_from_webcam(data['name'])
-            return {'type': 'user_added_from_webcam', 'data': result}
-            
-        elif message_type == 'reboot_system':
-            result = await self.reboot_system()
-            return {'type': 'reboot_response', 'data': result}
-            
-        elif message_type == 'reset_face_data':
-            result = await self.reset_face_data()
-            return {'type': 'reset_face_data_response', 'data': result}
-            
-        return None
+        handler = self._message_handlers.get(data.get('type'))
+        if handler is None:
+            return None
+        return await handler(data)
+    
+    async def _handle_add_user(self, data: dict) -> dict:
+        result = await self.add_user(data['name'], data['image'], data.get('authorized', True))
+        return {'type': 'user_added', 'data': result}
+    
+    async def _handle_remove_user(self, data: dict) -> dict:
+        # Frontend sends either 'id' or 'name', backend remove_user expects name
+        user_identifier = data.get('id') or data.get('name')
+        result = await self.remove_user(user_identifier)
+        return {'type': 'user_removed', 'data': result}
+    
+    async def _handle_unlock_door(self, data: dict) -> dict:
+        duration = data.get('duration', None)
+        success = self.door_lock.unlock_door(duration)
+        if success:
+            await self.broadcast_event('door_unlocked', {
+                'user': 'Manual',
+                'duration': duration or self.door_lock.lock_duration,
+                'auto_unlock': False
+            })
+        return {'type': 'unlock_response', 'data': {'success': success}}
+    
+    async def _handle_lock_door(self, data: dict) -> dict:
+        success = self.door_lock.force_lock()
+        if success:
+            await self.broadcast_event('door_locked', {'manual': True})
+        return {'type': 'lock_response', 'data': {'success': success}}
+    
+    async def _handle_get_door_status(self, data: dict) -> dict:
+        return {'type': 'door_status', 'data': self.door_lock.get_status()}
+    
+    async def _handle_set_user_authorization(self, data: dict) -> dict:
+        result = await self.set_user_authorization(data['name'], data['authorized'])
+        return {'type': 'authorization_response', 'data': result}
+    
+    async def _handle_update_door_config(self, data: dict) -> dict:
+        result = await self.update_door_config(data.get('config', {}))
+        return {'type': 'config_response', 'data': result}
+    
+    async def _handle_get_users(self, data: dict) -> dict:
+        if self._users_cache is None:
+            self._users_cache = [{'name': name, 'authorized': name in self.authorized_users, 'photo': self.user_photos.get(name, '')} 
+                                 for name in self.known_face_names]
+        return {'type': 'users_list', 'data': {'users': self._users_cache}}
+    
+    async def _handle_ping(self, data: dict) -> dict:
+        return {'type': 'pong'}
+    
+    async def _handle_update_performance_settings(self, data: dict) -> dict:
+        result = await self.update_performance_settings(data.get('settings', {}))
+        return {'type': 'performance_settings_response', 'data': result}
+    
+    async def _handle_capture_webcam_photo(self, data: dict) -> dict:
+        result = await self.capture_webcam_photo()
+        return {'type': 'webcam_capture_response', 'data': result}
+    
+    async def _handle_add_user_from_webcam(self, data: dict) -> dict:
+        result = await self.add_user_from_webcam(data['name'])
+        return {'type': 'user_added_from_webcam', 'data': result}
+    
+    async def _handle_reboot_system(self, data: dict) -> dict:
+        result = await self.reboot_system()
+        return {'type': 'reboot_response', 'data': result}
+    
+    async def _handle_reset_face_data(self, data: dict) -> dict:
+        result = await self.reset_face_data()
+        return {'type': 'reset_face_data_response', 'data': result}
     
     async def update_performance_settings(self, settings: dict) -> dict:
         """Update performance settings"""
@@ -795,8 +1697,10 @@ class FaceRecognitionSystem:
                 self.max_width = int(settings['max_width'])
             if 'adaptive_quality' in settings:
                 self.adaptive_quality = bool(settings['adaptive_quality'])
+            if 'min_face_size' in settings:
+                self.min_face_size = int(settings['min_face_size'])
             
-            self.save_config()
+            self.schedule_save(config=True)
             
             return {
                 'success': True,
@@ -805,7 +1709,8 @@ class FaceRecognitionSystem:
                     'recognition_interval': self.recognition_interval,
                     'jpeg_quality': self.jpeg_quality,
                     'max_width': self.max_width,
-                    'adaptive_quality': self.adaptive_quality
+                    'adaptive_quality': self.adaptive_quality,
+                    'min_face_size': self.min_face_size
                 }
             }
         except Exception as e:
@@ -816,27 +1721,25 @@ class FaceRecognitionSystem:
         """Add new user with base64 image data"""
         try:
             # Decode base64 image
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Get face encoding
-            face_locations = face_recognition.face_locations(rgb_image, model=self.model)
-            if len(face_locations) != 1:
-                return {'success': False, 'error': 'Expected one face, found none or multiple'}
+            loop = asyncio.get_event_loop()
+            image = await loop.run_in_executor(self.encode_pool, self._decode_image, image_data)
             
-            face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-            face_encoding = face_encodings[0]
+            # Get face encoding in the recognition pool, off the event loop
+            face_locations, face_encoding = await self._run_in_recognition_pool(
+                _detect_and_encode_full, image, 1, self.model
+            )
+            if len(face_locations) != 1 or face_encoding is None:
+                return {'success': False, 'error': 'Expected one face, found none or multiple'}
             
             # Add to known faces
-            self.known_face_encodings.append(face_encoding)
             self.known_face_names.append(name)
+            self._append_known_encoding(face_encoding)
             
             if authorized:
                 self.authorized_users.add(name)
+            self._rebuild_authorized_mask()
             
-            self.save_face_data()
+            self.schedule_save(face_data=True)
             
             await self.broadcast_event('user_added', {
                 'name': name, 
@@ -854,14 +1757,15 @@ class FaceRecognitionSystem:
             print(f"Attempting to remove user: '{name}'")
             print(f"Known users: {self.known_face_names}")
             
-            if name in self.known_face_names:
-                index = self.known_face_names.index(name)
+            index = self._name_index.get(name)
+            if index is not None:
                 print(f"Found user at index: {index}")
                 
                 self.known_face_names.pop(index)
-                self.known_face_encodings.pop(index)
                 self.authorized_users.discard(name)
-                self.save_face_data()
+                self._delete_user_photo(name)
+                self._remove_known_encoding(index)
+                self.schedule_save(face_data=True)
                 
                 print(f"Successfully removed user: '{name}'")
                 await self.broadcast_event('user_removed', {'name': name})
@@ -877,15 +1781,16 @@ class FaceRecognitionSystem:
     async def set_user_authorization(self, name: str, authorized: bool) -> dict:
         """Set user authorization status"""
         try:
-            if name not in self.known_face_names:
+            if name not in self._name_index:
                 return {'success': False, 'error': 'User not found'}
             
             if authorized:
                 self.authorized_users.add(name)
             else:
                 self.authorized_users.discard(name)
+            self._rebuild_authorized_mask()
             
-            self.save_face_data()
+            self.schedule_save(face_data=True)
             
             await self.broadcast_event('user_authorization_changed', {
                 'name': name, 
@@ -907,7 +1812,7 @@ class FaceRecognitionSystem:
             if 'lock_duration' in config:
                 self.door_lock.lock_duration = int(config['lock_duration'])
             
-            self.save_config()
+            self.schedule_save(config=True)
             
             await self.broadcast_event('config_updated', {
                 'auto_unlock': self.auto_unlock,
@@ -924,82 +1829,72 @@ class FaceRecognitionSystem:
         """Log recognition events"""
         try:
             log_entry = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': self._timestamp(),
                 'name': name,
                 'confidence': confidence,
                 'is_authorized': is_authorized,
                 'door_unlocked': self.door_lock.is_unlocked
             }
 
-            # Load existing logs
-            logs = []
-            if os.path.exists(self.log_file):
-                try:
-                    with open(self.log_file, 'r') as f:
-                        # Check if file is empty before loading JSON
-                        content = f.read()
-                        if content:
-                            logs = json.loads(content)
-                        else:
-                            print(f"Log file {self.log_file} is empty. Starting with empty log.")
-                except json.JSONDecodeError:
-                    print(f"Error decoding JSON from {self.log_file}. Starting with empty log.")
-                    logs = [] # Initialize with empty list on error
-                except Exception as e:
-                    print(f"Unexpected error reading log file {self.log_file}: {e}")
-                    logs = [] # Initialize with empty list on error
-
-            # Add new entry and keep last 1000
-            logs.append(log_entry)
-            logs = logs[-1000:]
-
-            # Save logs
-            with open(self.log_file, 'w') as f:
-                json.dump(logs, f, indent=2)
+            # Append a single line instead of rewriting the whole log
+            await asyncio.get_event_loop().run_in_executor(
+                None,
+                self._append_log_line,
+                _json_dumps(log_entry)
+            )
 
             # Broadcast recognition event
             await self.broadcast_event('recognition', log_entry)
 
         except Exception as e:
-            # This catch is for errors *during* logging after initial load attempt
             print(f"Error logging recognition: {e}")
     
+    def _append_log_line(self, line: str) -> None:
+        """Append one JSON line to the recognition log, trimming it every max_log_entries appends"""
+        with self._log_lock:
+            with open(self.log_file, 'a') as f:
+                f.write(line + '\n')
+            self._log_appends += 1
+            if self._log_appends >= self.max_log_entries:
+                self.trim_log_file()
+    
+    def trim_log_file(self) -> None:
+        """Keep only the last max_log_entries lines of the recognition log"""
+        self._log_appends = 0
+        if not os.path.exists(self.log_file):
+            return
+        try:
+            with open(self.log_file, 'r') as f:
+                total = 0
+                lines = deque(maxlen=self.max_log_entries)
+                for line in f:
+                    lines.append(line)
+                    total += 1
+            if total > self.max_log_entries:
+                with open(self.log_file, 'w') as f:
+                    f.writelines(lines)
+                print(f"Trimmed recognition log to last {self.max_log_entries} entries")
+        except Exception as e:
+            print(f"Error trimming log file {self.log_file}: {e}")
+    
     async def capture_webcam_photo(self) -> dict:
         """Capture a single photo from the webcam"""
         try:
-            if not self.camera or not self.camera.isOpened():
-                # Try to open camera if not already open
-                for camera_index in [0, 1, 2]:
-                    self.camera = cv2.VideoCapture(camera_index)
-                    if self.camera.isOpened():
-                        print(f"Successfully opened camera at index {camera_index}")
-                        break
-                    else:
-                        self.camera.release()
-                
-                if not self.camera or not self.camera.isOpened():
-                    return {'success': False, 'error': 'Failed to open camera'}
-                
-                # Set camera properties
-                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            if not await self._ensure_camera():
+                return {'success': False, 'error': 'Failed to open camera'}
             
             # Capture frame
-            ret, frame = self.camera.read()
+            loop = asyncio.get_event_loop()
+            ret, frame = await loop.run_in_executor(None, self._read_frame)
             if not ret:
                 return {'success': False, 'error': 'Failed to capture frame'}
             
-            # Convert frame to JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
-            ret_encode, buffer = cv2.imencode('.jpg', frame, encode_param)
+            # Convert frame to base64 JPEG
+            base64_image = await loop.run_in_executor(self.encode_pool, self._encode_photo_base64, frame)
             
-            if not ret_encode:
+            if base64_image is None:
                 return {'success': False, 'error': 'Failed to encode image'}
             
-            # Convert to base64
-            base64_image = base64.b64encode(buffer).decode('utf-8')
-            
             return {
                 'success': True,
                 'image': f'data:image/jpeg;base64,{base64_image}'
@@ -1009,26 +1904,46 @@ class FaceRecognitionSystem:
             print(f"Error capturing webcam photo: {e}")
             return {'success': False, 'error': str(e)}
     
+    @staticmethod
+    def _encode_photo_base64(image) -> Optional[str]:
+        """Encode an image as a base64 JPEG string, or None if encoding fails (runs on encode_pool)"""
+        ret_encode, buffer = cv2.imencode('.jpg', image, FaceRecognitionSystem.PHOTO_JPEG_PARAMS)
+        if not ret_encode:
+            return None
+        return base64.b64encode(buffer).decode('ascii')  # Straight from the encoder's buffer, no bytes copy
+    
+    @classmethod
+    def _decode_image(cls, image_data: str):
+        """Decode a base64 data URL (or bare base64) into a BGR image (runs on encode_pool)"""
+        # Slice past the "data:image/...;base64," header once instead of split() copying both halves
+        image_bytes = base64.b64decode(image_data[image_data.find(',') + 1:])
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image")
+        
+        # Shrink large uploads to fit a frame slot, so they never force a recognition pool restart
+        max_width, max_height = cls.FRAME_SLOT_SIZE
+        height, width = image.shape[:2]
+        scale = min(max_width / width, max_height / height)
+        if scale < 1:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image
+    
+    async def _produce_enrollment_frames(self, frames: asyncio.Queue) -> None:
+        """Read enrollment frames into the queue every 0.3s, tagged with their capture time"""
+        loop = asyncio.get_event_loop()
+        while True:
+            ret, frame = await loop.run_in_executor(None, self._read_frame)
+            await frames.put((ret, frame, loop.time()))
+            await asyncio.sleep(0.3)
+    
     async def add_user_from_webcam(self, name: str, authorized: bool = True, num_photos: int = 5) -> dict:
         """Add user by capturing multiple photos directly from webcam for improved accuracy"""
         try:
-            if not self.camera or not self.camera.isOpened():
-                # Try to open camera if not already open
-                for camera_index in [0, 1, 2]:
-                    self.camera = cv2.VideoCapture(camera_index)
-                    if self.camera.isOpened():
-                        print(f"Successfully opened camera at index {camera_index}")
-                        break
-                    else:
-                        self.camera.release()
-                
-                if not self.camera or not self.camera.isOpened():
-                    return {'success': False, 'error': 'Failed to open camera'}
-                
-                # Set camera properties
-                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            if not await self._ensure_camera():
+                return {'success': False, 'error': 'Failed to open camera'}
             
             print(f"📸 Starting multi-photo capture for user '{name}' - {num_photos} photos")
             
@@ -1042,97 +1957,89 @@ class FaceRecognitionSystem:
             # Give user time to position themselves
             await asyncio.sleep(1)
             
-            while capture_count < num_photos and attempts < max_attempts:
-                attempts += 1
-                
-                # Capture frame
-                ret, frame = self.camera.read()
-                if not ret:
-                    print(f"⚠️ Failed to capture frame on attempt {attempts}")
-                    await asyncio.sleep(0.2)
-                    continue
-                
-                # Convert to RGB for face recognition
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Detect faces
-                face_locations = face_recognition.face_locations(rgb_frame, model=self.model)
-                
-                if len(face_locations) != 1:
-                    print(f"⚠️ Attempt {attempts}: Expected 1 face, found {len(face_locations)}. Retrying...")
-                    await asyncio.sleep(0.3)
-                    continue
-                
-                # Get face encoding
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                if not face_encodings:
-                    print(f"⚠️ Attempt {attempts}: Failed to encode face. Retrying...")
-                    await asyncio.sleep(0.3)
-                    continue
-                
-                face_encoding = face_encodings[0]
-                face_location = face_locations[0]
-                
-                # Calculate face area to select best photo
-                top, right, bottom, left = face_location
-                face_area = (right - left) * (bottom - top)
-                
-                # Check quality - face should be reasonably sized
-                frame_area = frame.shape[0] * frame.shape[1]
-                face_ratio = face_area / frame_area
-                
-                if face_ratio < 0.05:  # Face too small
-                    print(f"⚠️ Attempt {attempts}: Face too small ({face_ratio:.3f}). Move closer.")
-                    await asyncio.sleep(0.3)
-                    continue
-                
-                if face_ratio > 0.6:  # Face too large
-                    print(f"⚠️ Attempt {attempts}: Face too large ({face_ratio:.3f}). Move back.")
-                    await asyncio.sleep(0.3)
-                    continue
-                
-                # Check if this face is already known (only on first encoding)
-                if capture_count == 0 and len(self.known_face_encodings) > 0:
-                    matches = face_recognition.compare_faces(
-                        self.known_face_encodings, 
-                        face_encoding, 
-                        tolerance=self.tolerance
+            # Frames are read by a producer task while the previous frame is being
+            # detected/encoded on an executor thread
+            loop = asyncio.get_event_loop()
+            frames = asyncio.Queue(maxsize=2)
+            producer = asyncio.create_task(self._produce_enrollment_frames(frames))
+            resume_at = 0.0  # Frames captured before this are skipped (pause between poses)
+            
+            try:
+                while capture_count < num_photos and attempts < max_attempts:
+                    ret, frame, captured_at = await frames.get()
+                    if captured_at < resume_at:
+                        continue
+                    attempts += 1
+                    
+                    if not ret:
+                        print(f"⚠️ Failed to capture frame on attempt {attempts}")
+                        continue
+                    
+                    # Detect (at half size) and encode in the recognition pool; frame stays BGR for the photo crop
+                    face_locations, face_encoding = await self._run_in_recognition_pool(
+                        _detect_and_encode_full, frame, 2, self.model
                     )
-                    if any(matches):
-                        # Find the best match
-                        face_distances = face_recognition.face_distance(
-                            self.known_face_encodings, 
-                            face_encoding
-                        )
-                        best_match_index = np.argmin(face_distances)
-                        existing_name = self.known_face_names[best_match_index]
-                        return {'success': False, 'error': f'This face is already registered as "{existing_name}"'}
-                
-                # Store the encoding
-                collected_encodings.append(face_encoding)
-                capture_count += 1
-                
-                # Store the best photo (largest face)
-                if face_area > best_face_area:
-                    best_face_area = face_area
-                    # Extract and save face photo for profile
-                    padding = 30
-                    face_crop = frame[max(0, top-padding):min(frame.shape[0], bottom+padding), 
-                                     max(0, left-padding):min(frame.shape[1], right+padding)]
-                    best_photo = face_crop.copy()
-                
-                print(f"✅ Captured photo {capture_count}/{num_photos} (face ratio: {face_ratio:.3f})")
-                
-                # Broadcast progress to clients
-                await self.broadcast_event('user_enrollment_progress', {
-                    'name': name,
-                    'current': capture_count,
-                    'total': num_photos,
-                    'message': f'Captured photo {capture_count}/{num_photos}'
-                })
-                
-                # Wait between captures to allow for different poses/expressions
-                await asyncio.sleep(0.8)
+                    
+                    if len(face_locations) != 1:
+                        print(f"⚠️ Attempt {attempts}: Expected 1 face, found {len(face_locations)}. Retrying...")
+                        continue
+                    
+                    if face_encoding is None:
+                        print(f"⚠️ Attempt {attempts}: Failed to encode face. Retrying...")
+                        continue
+                    
+                    face_location = face_locations[0]
+                    
+                    # Calculate face area to select best photo
+                    top, right, bottom, left = face_location
+                    face_area = (right - left) * (bottom - top)
+                    
+                    # Check quality - face should be reasonably sized
+                    frame_area = frame.shape[0] * frame.shape[1]
+                    face_ratio = face_area / frame_area
+                    
+                    if face_ratio < 0.05:  # Face too small
+                        print(f"⚠️ Attempt {attempts}: Face too small ({face_ratio:.3f}). Move closer.")
+                        continue
+                    
+                    if face_ratio > 0.6:  # Face too large
+                        print(f"⚠️ Attempt {attempts}: Face too large ({face_ratio:.3f}). Move back.")
+                        continue
+                    
+                    # Check if this face is already known (only on first encoding)
+                    if capture_count == 0 and len(self._known_matrix) > 0:
+                        best_match_index, best_distance = self._best_match(face_encoding)
+                        if best_distance <= self.tolerance:
+                            existing_name = self.known_face_names[best_match_index]
+                            return {'success': False, 'error': f'This face is already registered as "{existing_name}"'}
+                    
+                    # Store the encoding
+                    collected_encodings.append(face_encoding)
+                    capture_count += 1
+                    
+                    # Store the best photo (largest face)
+                    if face_area > best_face_area:
+                        best_face_area = face_area
+                        # Extract and save face photo for profile
+                        padding = 30
+                        face_crop = frame[max(0, top-padding):min(frame.shape[0], bottom+padding), 
+                                         max(0, left-padding):min(frame.shape[1], right+padding)]
+                        best_photo = face_crop.copy()
+                    
+                    print(f"✅ Captured photo {capture_count}/{num_photos} (face ratio: {face_ratio:.3f})")
+                    
+                    # Broadcast progress to clients
+                    await self.broadcast_event('user_enrollment_progress', {
+                        'name': name,
+                        'current': capture_count,
+                        'total': num_photos,
+                        'message': f'Captured photo {capture_count}/{num_photos}'
+                    })
+                    
+                    # Skip frames for a moment to allow for different poses/expressions
+                    resume_at = loop.time() + 0.8
+            finally:
+                producer.cancel()
             
             if capture_count < num_photos:
                 return {
@@ -1142,10 +2049,11 @@ class FaceRecognitionSystem:
             
             # Create averaged encoding for better accuracy
             print(f"🔄 Creating averaged face encoding from {len(collected_encodings)} photos")
-            averaged_encoding = np.mean(collected_encodings, axis=0)
+            encodings_array = np.asarray(collected_encodings)
+            averaged_encoding = encodings_array.mean(axis=0)
             
             # Validate the averaged encoding by comparing with individual encodings
-            distances = [face_recognition.face_distance([averaged_encoding], enc)[0] for enc in collected_encodings]
+            distances = np.linalg.norm(encodings_array - averaged_encoding, axis=1)
             avg_distance = np.mean(distances)
             max_distance = np.max(distances)
             
@@ -1153,31 +2061,30 @@ class FaceRecognitionSystem:
             
             if max_distance > 0.4:  # If any individual encoding is too different
                 print("⚠️ High variance in face encodings, using median instead of mean")
-                averaged_encoding = np.median(collected_encodings, axis=0)
+                averaged_encoding = np.median(encodings_array, axis=0)
             
             # Convert best face photo to base64 for storage
             face_photo_b64 = None
             if best_photo is not None:
-                encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
-                ret_encode, buffer = cv2.imencode('.jpg', best_photo, encode_param)
-                
-                if ret_encode:
-                    face_photo_b64 = base64.b64encode(buffer).decode('utf-8')
+                loop = asyncio.get_event_loop()
+                face_photo_b64 = await loop.run_in_executor(self.encode_pool, self._encode_photo_base64, best_photo)
             
             # Add to known faces
-            self.known_face_encodings.append(averaged_encoding)
             self.known_face_names.append(name)
+            self._append_known_encoding(averaged_encoding)
             
             # Store face photo
             if face_photo_b64:
                 self.user_photos[name] = f'data:image/jpeg;base64,{face_photo_b64}'
+                self._save_user_photo(name, self.user_photos[name])
             
             # Set authorization
             if authorized:
                 self.authorized_users.add(name)
+            self._rebuild_authorized_mask()
             
             # Save face data with photo
-            self.save_face_data_with_photos()
+            self.schedule_save(face_data=True)
             
             # Broadcast event
             await self.broadcast_event('user_added', {
@@ -1213,15 +2120,19 @@ class FaceRecognitionSystem:
             print("🔄 Resetting all face recognition data...")
             
             # Clear all face data from memory
-            self.known_face_encodings = []
             self.known_face_names = []
             self.authorized_users = set()
             self.user_photos = {}
+            self._set_known_encodings([])
             
-            # Remove face data file
-            if os.path.exists(self.data_file):
-                os.remove(self.data_file)
-                print(f"✅ Removed face data file: {self.data_file}")
+            # Remove face data files and photos
+            for data_file in (self.data_file, self.legacy_data_file):
+                if os.path.exists(data_file):
+                    os.remove(data_file)
+                    print(f"✅ Removed face data file: {data_file}")
+            if os.path.isdir(self.photos_dir):
+                shutil.rmtree(self.photos_dir)
+                print(f"✅ Removed user photos: {self.photos_dir}")
             
             # Clear recognition log
             if os.path.exists(self.log_file):
@@ -1277,49 +2188,92 @@ class FaceRecognitionSystem:
             print(f"Error rebooting system: {e}")
             return {'success': False, 'error': str(e)}
 
-    def draw_face_annotations(self, frame, results):
-        """Draw face detection rectangles and confidence scores on frame"""
-        annotated_frame = frame.copy()
+    @staticmethod
+    def _face_arrays(faces) -> dict:
+        """Struct-of-arrays form of a results['faces'] list, built in one pass
+        (process_frame always sets name, confidence, is_authorized and location)"""
+        names, confs, auth, boxes = [], [], [], []
+        for face in faces:
+            location = face['location']
+            names.append(face['name'])
+            confs.append(face['confidence'])
+            auth.append(face['is_authorized'])
+            boxes.append((location['top'], location['right'], location['bottom'], location['left']))
+        return {
+            'names': names,
+            'known': np.array([name != 'Unknown' for name in names], dtype=bool),
+            'confs': np.array(confs, dtype=np.float64),
+            'auth': np.array(auth, dtype=bool),
+            'boxes': np.array(boxes, dtype=np.int32).reshape(-1, 4)
+        }
+    
+    def draw_face_annotations(self, frame, results, face_arrays=None):
+        """Draw face detection rectangles and confidence scores on frame (in place);
+        face_arrays is _face_arrays(results['faces']) if the caller already has it"""
+        annotated_frame = frame
         
-        if not results or 'faces' not in results:
-            return annotated_frame
-            
-        height, width = annotated_frame.shape[:2]
+        if not results or not results.get('faces'):
+            return annotated_frame  # Nothing to draw (common while the scene is empty)
+        if face_arrays is None:
+            face_arrays = self._face_arrays(results['faces'])
         
-        for face in results['faces']:
-            if 'location' not in face:
-                continue
-                
-            location = face['location']
-            name = face.get('name', 'Unknown')
-            confidence = face.get('confidence', 0.0)
-            is_authorized = face.get('is_authorized', False)
-            
-            # Get face coordinates
-            top = max(0, int(location['top']))
-            right = min(width, int(location['right']))
-            bottom = min(height, int(location['bottom']))
-            left = max(0, int(location['left']))
-            
+        # Between recognitions every frame carries the same face arrays, so the
+        # primitives worked out for an earlier frame are simply drawn again
+        cached_arrays, cached_shape, primitives = self._annotation_cache
+        if cached_arrays is not face_arrays or cached_shape != annotated_frame.shape:
+            height, width = annotated_frame.shape[:2]
+            primitives = self._annotation_primitives(face_arrays, width, height)
+            self._annotation_cache = (face_arrays, annotated_frame.shape, primitives)
+        box_outlines, label_backgrounds, labels, indicators, accuracy = primitives
+        
+        # Pass 2: one polylines/fillPoly call per colour instead of one rectangle call per face
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        for box_color, outlines in box_outlines.items():
+            cv2.polylines(annotated_frame, outlines, True, box_color, 3)
+        for text_bg_color, backgrounds in label_backgrounds.items():
+            cv2.fillPoly(annotated_frame, backgrounds, text_bg_color, cv2.LINE_4)
+        for display_text, origin, text_color in labels:
+            cv2.putText(annotated_frame, display_text, origin, font, 0.7, text_color, 2)
+        for center, radius, fill_color, ring_color in indicators:
+            cv2.circle(annotated_frame, center, radius, fill_color, -1, cv2.LINE_4)
+            cv2.circle(annotated_frame, center, radius, ring_color, 2)
+        
+        # Overall confidence display in bottom right corner, copied from the pre-rendered badge
+        if accuracy is not None:
+            badge, badge_x, badge_y = accuracy
+            _blit(annotated_frame, badge, badge_x, badge_y)
+        
+        return annotated_frame
+    
+    @staticmethod
+    def _annotation_primitives(face_arrays: dict, width: int, height: int) -> tuple:
+        """Everything draw_face_annotations draws for these faces on a width x height frame:
+        (box outlines by colour, label backgrounds by colour, labels, indicators, accuracy or None)"""
+        # Pass 1: work out every primitive, grouping boxes and label backgrounds by colour
+        box_outlines = {}  # BGR color -> list of corner arrays
+        label_backgrounds = {}
+        labels = []  # (text, origin, color)
+        indicators = []  # (center, radius, fill color, ring color)
+        font_scale = 0.7
+        thickness = 2
+        
+        styles = []  # (box color, label bg color, label color, label, indicator colors or None)
+        text_sizes = []
+        for name, confidence, is_authorized in zip(
+                face_arrays['names'], face_arrays['confs'].tolist(), face_arrays['auth'].tolist()):
             # Choose colors based on authorization status
             if name == "Unknown":
-                # Red for unknown faces
-                box_color = (0, 0, 255)  # BGR format
-                text_color = (255, 255, 255)
-                text_bg_color = (0, 0, 255)
+                # Red for unknown faces, no indicator
+                style = ((0, 0, 255), (0, 0, 255), (255, 255, 255))  # BGR format
+                indicator_colors = None
             elif is_authorized:
-                # Green for authorized users
-                box_color = (0, 255, 0)
-                text_color = (0, 0, 0)
-                text_bg_color = (0, 255, 0)
+                # Green for authorized users, green checkmark area
+                style = ((0, 255, 0), (0, 255, 0), (0, 0, 0))
+                indicator_colors = ((0, 255, 0), (0, 0, 0))
             else:
-                # Orange for unauthorized users
-                box_color = (0, 165, 255)
-                text_color = (255, 255, 255)
-                text_bg_color = (0, 165, 255)
-            
-            # Draw face rectangle with thicker border
-            cv2.rectangle(annotated_frame, (left, top), (right, bottom), box_color, 3)
+                # Orange for unauthorized users, red X area
+                style = ((0, 165, 255), (0, 165, 255), (255, 255, 255))
+                indicator_colors = ((0, 0, 255), (255, 255, 255))
             
             # Prepare text with confidence percentage
             if confidence > 0:
@@ -1327,104 +2281,86 @@ class FaceRecognitionSystem:
             else:
                 display_text = name
             
-            # Calculate text size
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.7
-            thickness = 2
-            (text_width, text_height), baseline = cv2.getTextSize(display_text, font, font_scale, thickness)
-            
-            # Draw text background rectangle
-            text_x = left
-            text_y = top - 10
-            
-            # Ensure text stays within frame bounds
-            if text_y < text_height + baseline:
-                text_y = bottom + text_height + 10
-            
-            cv2.rectangle(annotated_frame, 
-                         (text_x, text_y - text_height - baseline), 
-                         (text_x + text_width, text_y + baseline), 
-                         text_bg_color, -1)
-            
-            # Draw text
-            cv2.putText(annotated_frame, display_text, (text_x, text_y), 
-                       font, font_scale, text_color, thickness)
-            
-            # Add authorization status indicator (small circle in corner)
-            if name != "Unknown":
-                indicator_radius = 8
-                indicator_x = right - indicator_radius - 5
-                indicator_y = top + indicator_radius + 5
+            (text_width, text_height), baseline = _text_size(display_text, font_scale, thickness)
+            styles.append(style + (display_text, indicator_colors))
+            text_sizes.append((text_width, text_height, baseline))
+        
+        if styles:
+            # Clipping and label/indicator placement for all faces at once
+            geometry = _annotation_geometry(
+                face_arrays['boxes'], np.array(text_sizes, dtype=np.int32), width, height
+            ).tolist()
+            
+            for (box_color, text_bg_color, text_color, display_text, indicator_colors), face_geometry in zip(styles, geometry):
+                top, right, bottom, left, text_y, bg_top, bg_right, bg_bottom, indicator_x, indicator_y = face_geometry
                 
-                if is_authorized:
-                    # Green checkmark area
-                    cv2.circle(annotated_frame, (indicator_x, indicator_y), indicator_radius, (0, 255, 0), -1)
-                    cv2.circle(annotated_frame, (indicator_x, indicator_y), indicator_radius, (0, 0, 0), 2)
-                else:
-                    # Red X area
-                    cv2.circle(annotated_frame, (indicator_x, indicator_y), indicator_radius, (0, 0, 255), -1)
-                    cv2.circle(annotated_frame, (indicator_x, indicator_y), indicator_radius, (255, 255, 255), 2)
+                # Face rectangle with thicker border
+                box_outlines.setdefault(box_color, []).append(
+                    np.array([(left, top), (right, top), (right, bottom), (left, bottom)], dtype=np.int32)
+                )
+                
+                # Text background rectangle and text
+                label_backgrounds.setdefault(text_bg_color, []).append(
+                    np.array([(left, bg_top), (bg_right, bg_top), (bg_right, bg_bottom), (left, bg_bottom)], dtype=np.int32)
+                )
+                labels.append((display_text, (left, text_y), text_color))
+                
+                # Authorization status indicator (small circle in corner)
+                if indicator_colors is not None:
+                    indicators.append(((indicator_x, indicator_y), _INDICATOR_RADIUS) + indicator_colors)
         
-        # Add overall confidence display in bottom right corner
-        if results['faces']:
+        # Overall accuracy in bottom right
+        accuracy = None
+        if styles:
             # Find the highest confidence face for overall display
-            max_confidence = max(face.get('confidence', 0.0) for face in results['faces'])
-            recognized_faces = [f for f in results['faces'] if f.get('name', 'Unknown') != 'Unknown']
+            max_confidence = float(face_arrays['confs'].max())
             
-            if max_confidence > 0 and recognized_faces:
-                # Display overall accuracy in bottom right
+            if max_confidence > 0 and face_arrays['known'].any():
                 accuracy_text = f"Accuracy: {max_confidence*100:.1f}%"
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                font_scale = 0.8
-                thickness = 2
+                (acc_text_width, acc_text_height), acc_baseline = _text_size(accuracy_text, 0.8, 2)
                 
-                (acc_text_width, acc_text_height), acc_baseline = cv2.getTextSize(
-                    accuracy_text, font, font_scale, thickness)
-                
-                # Position in bottom right corner
+                # Position in bottom right corner; the badge includes the background rectangle
                 acc_x = width - acc_text_width - 15
                 acc_y = height - 15
-                
-                # Background rectangle for better readability
-                cv2.rectangle(annotated_frame,
-                             (acc_x - 10, acc_y - acc_text_height - acc_baseline - 5),
-                             (acc_x + acc_text_width + 10, acc_y + acc_baseline + 5),
-                             (0, 0, 0), -1)
-                
-                # White text with black background
-                cv2.putText(annotated_frame, accuracy_text, (acc_x, acc_y),
-                           font, font_scale, (255, 255, 255), thickness)
+                accuracy = (
+                    _accuracy_badge(accuracy_text),
+                    acc_x - 10,
+                    acc_y - acc_text_height - acc_baseline - 5
+                )
         
-        return annotated_frame
+        return box_outlines, label_backgrounds, labels, indicators, accuracy
 
     def cleanup(self):
         """Cleanup resources"""
         print("Cleaning up resources...")
-        self.stop_camera_stream()
+        self._stop_camera_stream_sync()
+        self._stop_recognition_pool()
+        self.encode_pool.shutdown(wait=False)
+        self.flush_pending_saves()
         self.door_lock.cleanup()
 
 async def main():
     """Main function to run the WebSocket server"""
-    # Install psutil if not already installed
-    try:
-        import psutil
-    except ImportError:
-        import subprocess
-        import sys
-        print("Installing psutil package...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "psutil"])
-        import psutil
-    
     system = FaceRecognitionSystem()
     
+    # Stop on SIGINT/SIGTERM (e.g. systemctl stop) so cleanup runs while the loop is still alive
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
     try:
         # Set up WebSocket server with more conservative settings
         async with websockets.serve(
             system.handle_websocket,
             "0.0.0.0",
             8765,
-            ping_interval=None,  # Disable ping to avoid potential issues
-            max_size=None  # Let websockets library handle message size
+            ping_interval=20,  # Ping so dead clients are dropped along with their send queues
+            ping_timeout=10,
+            max_size=None,  # Let websockets library handle message size
+            max_queue=2,  # Clients only send small control messages
+            write_limit=2**20,  # About a dozen stream frames buffered before a send waits
+            compression=None  # Frames are already JPEG and control messages are tiny; deflate only costs CPU
         ):
             print("WebSocket server started at ws://0.0.0.0:8765")
             print("Door lock system ready")
@@ -1435,13 +2371,17 @@ async def main():
             print(f"- Max frame width: {system.max_width}px")
             print(f"- Adaptive quality: {'Enabled' if system.adaptive_quality else 'Disabled'}")
             print("Waiting for connections...")
-            await asyncio.Future()  # run forever
+            await stop.wait()
+            print("\nShutting down...")
     except Exception as e:
         print(f"Failed to start WebSocket server: {e}")
     finally:
         system.cleanup()
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
+        print("Using uvloop event loop")
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -28,7 +28,7 @@ if [ ! -d "smart_door_env" ]; then
     echo "Please create a virtual environment first:"
     echo "python -m venv smart_door_env"
     echo "source smart_door_env/bin/activate"
-    echo "pip install opencv-python face-recognition websockets RPi.GPIO"
+    echo "pip install opencv-python face-recognition websockets RPi.GPIO psutil"
     exit 1
 fi
 
@@ -44,7 +44,7 @@ sudo chmod 666 /dev/gpiomem 2>/dev/null || echo "$(date): Warning: Could not set
 
 # Install/update dependencies if needed
 echo "$(date): Checking Python dependencies..."
-pip install --quiet opencv-python face-recognition websockets asyncio RPi.GPIO
+pip install --quiet opencv-python face-recognition websockets asyncio RPi.GPIO psutil
 
 # Create required directories
 mkdir -p /home/raspberrypi/smart_door_lock/faces
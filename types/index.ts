@@ -15,7 +15,8 @@ export interface FaceDetectionResult {
 export interface FrameResult {
   faces: FaceDetectionResult[];
   timestamp: string;
-  door_status: {
+  // Only present in older server versions; door state now arrives as 'door_status' events
+  door_status?: {
     is_unlocked: boolean;
     pin: number;
     duration: number;
@@ -15,6 +15,17 @@ const getWebSocketUrl = (ip: string) => Platform.select({
 
 type EventCallback = (data: any) => void;
 
+// Convert a binary JPEG frame to base64 so it can be shown via a data URI
+const arrayBufferToBase64 = (buffer: ArrayBuffer) => {
+  const bytes = new Uint8Array(buffer);
+  const chunkSize = 0x8000;
+  let binary = '';
+  for (let i = 0; i < bytes.length; i += chunkSize) {
+    binary += String.fromCharCode.apply(null, Array.from(bytes.subarray(i, i + chunkSize)));
+  }
+  return btoa(binary);
+};
+
 class DoorLockApi {
   private ws: WebSocket | null = null;
   private reconnectTimer: ReturnType<typeof setTimeout> | null = null;
@@ -22,6 +33,8 @@ class DoorLockApi {
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
   private isConnecting = false;
+  // Results from the last 'frame_meta' message, paired with the binary frame that follows it
+  private pendingFrameResults: any = null;
 
   constructor() {
     this.loadSavedIP();
@@ -50,6 +63,7 @@ class DoorLockApi {
 
     try {
       this.ws = new WebSocket(getWebSocketUrl(SERVER_IP));
+      this.ws.binaryType = 'arraybuffer';
 
       this.ws.onopen = () => {
         console.log('WebSocket connected');
@@ -102,14 +116,32 @@ class DoorLockApi {
 
       this.ws.onmessage = (event) => {
         try {
+          // Binary messages are raw JPEG frames announced by a preceding 'frame_meta'
+          if (typeof event.data !== 'string') {
+            this.emit('frame', {
+              image: arrayBufferToBase64(event.data),
+              results: this.pendingFrameResults
+            });
+            this.pendingFrameResults = null;
+            return;
+          }
+
           const message = JSON.parse(event.data);
-          // Only log if the data is not a long base64 string
-          if (typeof message.data !== 'string' || !isBase64ImageData(message.data)) {
-            console.log('📨 Received WebSocket message:', message.type, message.data);
-          } else {
-            console.log('📨 Received WebSocket message:', message.type, '[Base64 Image Data]');
+          // Events queued together on the server arrive as one 'batch' message
+          const messages = message.type === 'batch' ? message.items : [message];
+          for (const item of messages) {
+            if (item.type === 'frame_meta') {
+              this.pendingFrameResults = item.data?.results ?? null;
+              continue;
+            }
+            // Only log if the data is not a long base64 string
+            if (typeof item.data !== 'string' || !isBase64ImageData(item.data)) {
+              console.log('📨 Received WebSocket message:', item.type, item.data);
+            } else {
+              console.log('📨 Received WebSocket message:', item.type, '[Base64 Image Data]');
+            }
+            this.emit(item.type, item.data);
           }
-          this.emit(message.type, message.data);
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
           console.log('Raw message data:', event.data);